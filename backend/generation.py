@@ -0,0 +1,809 @@
+"""
+Shared plumbing for AI description generation.
+
+The generator scripts at the repo root import this module (they put backend/
+on sys.path) so they share one rate limiter, one retry policy and one
+response parser instead of each hand-rolling a serial loop with a fixed sleep.
+"""
+
+import os
+import re
+import abc
+import json
+import time
+import logging
+import uuid
+import random
+import socket
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PROVIDER = "gemini"
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Rough size of one generated entry (2-4 HTML paragraphs plus JSON fields)
+EXPECTED_OUTPUT_TOKENS = 1200
+
+# Output ceiling assumed when sizing multi-term requests
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+
+# generation_fingerprint of a description an admin wrote or edited by hand;
+# regeneration never selects these
+MANUAL_FINGERPRINT = "manual"
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm-cache.sqlite3")
+
+
+class RateLimited(Exception):
+    """The provider asked us to slow down (HTTP 429 or equivalent)"""
+
+
+class BudgetExceeded(Exception):
+    """The API key ran out of balance; retrying will not help"""
+
+
+def classify_error(error: Exception) -> Optional[type]:
+    message = str(error).lower()
+    if "budget" in message:
+        return BudgetExceeded
+    if any(marker in message for marker in ("429", "rate limit", "ratelimit", "too many requests", "resource exhausted", "quota")):
+        return RateLimited
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)"""
+    return len(text or "") // 4 + 1
+
+
+def parse_json_response(response: str) -> dict:
+    """Parse a model reply that may be wrapped in a ```json fence"""
+    text = response.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text.strip())
+
+
+def validate_entry(entry) -> Optional[str]:
+    """Why a generated entry is unusable, or None if it is fine"""
+    if not isinstance(entry, dict):
+        return "entry is not an object"
+    if not isinstance(entry.get("description"), str) or not entry["description"].strip():
+        return "missing description"
+    for field in ("short_description", "category"):
+        if not isinstance(entry.get(field, ""), str):
+            return f"{field} is not a string"
+    for field in ("related_terms", "authority_links"):
+        if not isinstance(entry.get(field, []), list):
+            return f"{field} is not a list"
+    return None
+
+
+def terms_per_request(requested: int, max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> int:
+    """Clamp a requested batch size so N entries fit in the output limit"""
+    return max(1, min(requested, max_output_tokens // EXPECTED_OUTPUT_TOKENS))
+
+
+def batch_prompt(names: list, context: str) -> str:
+    listing = "\n".join(f"{index}. {name}" for index, name in enumerate(names, start=1))
+    return f"""Generate encyclopedia entries for each of these {len(names)} bariatric surgery terms:
+{listing}
+
+{context}
+
+Respond ONLY with a JSON array containing one object per term. Each object uses the structure above plus a "term" field holding the term exactly as listed. Never list a term as related to itself."""
+
+
+class ResponseCache:
+    """Content-addressed store of model replies in a local SQLite file.
+
+    Keys hash everything that determines the reply (provider, model, system
+    prompt, user prompt), so an identical request is answered from disk for
+    free. When the stored replies exceed max_bytes the least recently used
+    ones are evicted. The file is shared safely by the API server and any
+    number of generator processes; the running total of stored bytes lives
+    in the file too, so a write never has to re-sum the table.
+
+    Calls block on SQLite (and on other processes holding its lock), so
+    async code should go through aget()/aput(), which run on a thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL)")
+        # Seeds the total for a cache file written before it was tracked
+        self._db.execute("INSERT OR IGNORE INTO usage (id, total) SELECT 1, COALESCE(SUM(size), 0) FROM responses")
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """The shared cache configured by LLM_CACHE_PATH/LLM_CACHE_MAX_MB (0 disables it)"""
+        max_mb = float(os.environ.get("LLM_CACHE_MAX_MB", "256"))
+        if max_mb <= 0:
+            return None
+        return cls(os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH), int(max_mb * 1024 * 1024))
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode())
+        with self._lock:
+            # One write transaction, so the total stays exact across processes
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now)
+                )
+                total = self._add_to_total(size - (row[0] if row else 0))
+                if total > self.max_bytes:
+                    self._evict(total - self.max_bytes)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, response: str):
+        await asyncio.to_thread(self.put, key, response)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT total FROM usage WHERE id = 1").fetchone()[0]
+
+    def _add_to_total(self, delta: int) -> int:
+        self._db.execute("UPDATE usage SET total = total + ? WHERE id = 1", (delta,))
+        return self._db.execute("SELECT total FROM usage WHERE id = 1").fetchone()[0]
+
+    def _evict(self, excess: int):
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY used_at"):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._add_to_total(-freed)
+
+
+class TokenBucket:
+    """Continuous-refill token bucket holding at most one minute of budget"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount: float):
+        amount = min(amount, self.capacity)
+        # The lock makes waiters queue in arrival order instead of racing
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount: float):
+        """Charge (or refund, if negative) usage discovered after the fact"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets plus a shared 429 backoff.
+
+    A throttled response pauses every caller, not just the one that saw it,
+    and the pause doubles while throttling continues and decays on success.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 initial_backoff: float = 2.0, max_backoff: float = 120.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.resume_at = 0.0
+
+    async def acquire(self, tokens: int):
+        while True:
+            wait = self.resume_at - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if self.requests:
+            await self.requests.take(1)
+        if self.tokens:
+            await self.tokens.take(tokens)
+
+    def settle(self, estimated: int, actual: int):
+        if self.tokens:
+            self.tokens.adjust(actual - estimated)
+        if self.backoff:
+            self.backoff = self.backoff / 2 if self.backoff > self.initial_backoff else 0.0
+
+    def throttled(self) -> float:
+        self.backoff = min(self.max_backoff, max(self.initial_backoff, self.backoff * 2))
+        # Jitter keeps the workers from all retrying in the same instant
+        delay = self.backoff * random.uniform(0.75, 1.25)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+
+class LLMProvider(abc.ABC):
+    """Something that turns (system prompt, prompt) into reply text.
+
+    send() raises on failure; errors whose message mentions 429 / rate limits
+    or budget are classified by classify_error, so a provider only needs to
+    put the status in the message. name and model identify the provider in
+    cache keys and generation fingerprints.
+    """
+
+    name = ""
+    model = ""
+
+    @property
+    def setup_error(self) -> Optional[str]:
+        """Why this provider cannot send requests, or None if it can"""
+        return None
+
+    @property
+    def configured(self) -> bool:
+        return self.setup_error is None
+
+    @abc.abstractmethod
+    async def send(self, system_prompt: str, prompt: str, session_id: str) -> str:
+        """Reply text for one request"""
+
+
+class EmergentProvider(LLMProvider):
+    """The Emergent Universal Key via emergentintegrations.
+
+    LlmChat keeps conversation history per session, so reusing a single chat
+    would resend every earlier term as context; a fresh chat is bound per
+    request instead.
+    """
+
+    def __init__(self, api_key: Optional[str], name: str = DEFAULT_PROVIDER, model: str = DEFAULT_MODEL):
+        try:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+        except ImportError:
+            LlmChat = UserMessage = None
+        self._chat_class = LlmChat
+        self._message_class = UserMessage
+        self.api_key = api_key
+        self.name = name
+        self.model = model
+
+    @property
+    def setup_error(self) -> Optional[str]:
+        if self._chat_class is None:
+            return (
+                "emergentintegrations package not installed. Install with: pip install emergentintegrations "
+                "--extra-index-url https://d33sy5i8bnduwe.cloudfront.net/simple/"
+            )
+        if not self.api_key:
+            return "EMERGENT_LLM_KEY not configured"
+        return None
+
+    async def send(self, system_prompt: str, prompt: str, session_id: str) -> str:
+        if self._chat_class is None:
+            raise RuntimeError("emergentintegrations is not installed")
+        chat = self._chat_class(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_prompt
+        ).with_model(self.name, self.model)
+        return await chat.send_message(self._message_class(text=prompt))
+
+
+MOCK_CATEGORIES = [
+    "Procedures", "Complications", "Anatomy", "Nutrition", "Medications",
+    "Conditions", "Diagnostic Tests", "Patient Care", "Equipment", "Outcomes"
+]
+
+
+class MockProvider(LLMProvider):
+    """Offline stand-in that answers in the generators' JSON schema.
+
+    Latency, server errors, 429s and malformed (truncated) replies are drawn
+    at the configured rates. Draws are seeded per prompt and per repeat of
+    that prompt, so a run with the same seed fails the same terms on the same
+    attempts no matter how requests interleave.
+    """
+
+    name = "mock"
+
+    def __init__(self, model: str = "mock-1", latency: float = 0.5, jitter: float = 0.25,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, malformed_rate: float = 0.0,
+                 seed: int = 0):
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None) -> "MockProvider":
+        return cls(
+            model=model or "mock-1",
+            latency=float(os.environ.get("MOCK_LLM_LATENCY", "0.5")),
+            jitter=float(os.environ.get("MOCK_LLM_JITTER", "0.25")),
+            error_rate=float(os.environ.get("MOCK_LLM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.environ.get("MOCK_LLM_RATE_LIMIT_RATE", "0")),
+            malformed_rate=float(os.environ.get("MOCK_LLM_MALFORMED_RATE", "0")),
+            seed=int(os.environ.get("MOCK_LLM_SEED", "0"))
+        )
+
+    def draw(self, prompt: str) -> tuple:
+        """(outcome, delay) for the next request with this prompt, where
+        outcome is one of ok, error, rate_limited or malformed"""
+        with self._lock:
+            repeat = self._seen.get(prompt, 0)
+            self._seen[prompt] = repeat + 1
+        rng = random.Random(f"{self.seed}:{repeat}:{prompt}")
+        delay = max(0.0, self.latency * rng.uniform(1 - self.jitter, 1 + self.jitter))
+        roll = rng.random()
+        for outcome, rate in (("rate_limited", self.rate_limit_rate), ("error", self.error_rate),
+                              ("malformed", self.malformed_rate)):
+            if roll < rate:
+                return outcome, delay
+            roll -= rate
+        return "ok", delay
+
+    def reply(self, prompt: str, malformed: bool = False) -> str:
+        """A schema-valid reply to a single-term or batch prompt"""
+        candidates = []
+        match = re.search(r"\[.*?\]", prompt)
+        if match:
+            try:
+                candidates = [name for name in json.loads(match.group(0)) if isinstance(name, str)]
+            except json.JSONDecodeError:
+                pass
+        names = re.findall(r"^\d+\. (.+)$", prompt, re.M)
+        if names:
+            body = json.dumps([{"term": name, **self.entry(name, candidates)} for name in names])
+        else:
+            match = re.search(r'"([^"]+)"', prompt)
+            body = json.dumps(self.entry(match.group(1) if match else "Term", candidates))
+        return body[:len(body) // 2] if malformed else body
+
+    def entry(self, name: str, candidates: list) -> dict:
+        index = int(hashlib.sha256(name.encode()).hexdigest(), 16)
+        return {
+            "description": (
+                f"<p><strong>{name}</strong> is a bariatric surgery term generated by the mock provider.</p>"
+                "<p>This placeholder text has the shape of a real entry so the pipeline can be exercised offline.</p>"
+            ),
+            "short_description": f"{name} (mock entry)",
+            "category": MOCK_CATEGORIES[index % len(MOCK_CATEGORIES)],
+            "related_terms": [candidate for candidate in candidates if candidate != name][:3],
+            "authority_links": [
+                {"title": f"{name} overview", "url": "https://www.niddk.nih.gov/", "source": "NIH"}
+            ]
+        }
+
+    async def send(self, system_prompt: str, prompt: str, session_id: str) -> str:
+        outcome, delay = self.draw(prompt)
+        await asyncio.sleep(delay)
+        if outcome == "rate_limited":
+            raise RuntimeError("429 Too Many Requests (mock)")
+        if outcome == "error":
+            raise RuntimeError("500 Internal Server Error (mock)")
+        return self.reply(prompt, malformed=outcome == "malformed")
+
+
+class HttpProvider(LLMProvider):
+    """An OpenAI-compatible /v1/chat/completions endpoint, such as
+    mock_llm_server.py"""
+
+    name = "http"
+
+    def __init__(self, base_url: str, model: str = "mock-1", api_key: Optional[str] = None, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = None
+
+    async def send(self, system_prompt: str, prompt: str, session_id: str) -> str:
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        response = await self._client.post(f"{self.base_url}/v1/chat/completions", headers=headers, json={
+            "model": self.model,
+            "user": session_id,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} {response.reason_phrase}: {response.text[:200]}")
+        return response.json()["choices"][0]["message"]["content"]
+
+
+def provider_from_env(api_key: Optional[str] = None) -> LLMProvider:
+    """Provider selected by LLM_PROVIDER: emergent (default), mock or http.
+
+    LLM_MODEL overrides the model; http uses LLM_BASE_URL and mock reads the
+    MOCK_LLM_* knobs (see MockProvider.from_env).
+    """
+    kind = os.environ.get("LLM_PROVIDER", "emergent").lower()
+    model = os.environ.get("LLM_MODEL")
+    if kind == "mock":
+        return MockProvider.from_env(model)
+    if kind == "http":
+        return HttpProvider(os.environ.get("LLM_BASE_URL", "http://localhost:8011"), model or "mock-1", api_key)
+    if kind == "emergent":
+        return EmergentProvider(api_key, model=model or DEFAULT_MODEL)
+    raise ValueError(f"Unknown LLM_PROVIDER: {kind}")
+
+
+class GenerationClient:
+    """One configured LLM client shared by every worker.
+
+    The provider, system prompt and limiter are resolved once here; requests
+    from all workers go through complete(), which paces them and retries 429s.
+    stats counts requests, cache hits and throttling for benchmark reports.
+    """
+
+    def __init__(self, provider: LLMProvider, system_prompt: str, limiter: Optional[RateLimiter] = None,
+                 max_retries: int = 5, expected_output_tokens: int = EXPECTED_OUTPUT_TOKENS,
+                 cache: Optional[ResponseCache] = None):
+        self.llm = provider
+        self.system_prompt = system_prompt
+        self.limiter = limiter or RateLimiter()
+        self.provider = provider.name
+        self.model = provider.model
+        self.max_retries = max_retries
+        self.expected_output_tokens = expected_output_tokens
+        self.cache = cache
+        self.stats = Counter()
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the prompt and model behind a description"""
+        return ResponseCache.key(self.provider, self.model, self.system_prompt)[:16]
+
+    def stamp(self) -> dict:
+        """Fields recording what produced a description, for the term update"""
+        return {
+            "generation_fingerprint": self.fingerprint,
+            "generation_model": f"{self.provider}/{self.model}",
+            "generated_at": datetime.utcnow()
+        }
+
+    def stale_query(self) -> dict:
+        """Terms with a description produced by some other prompt or model"""
+        return {
+            "description": {"$nin": ["", None]},
+            "generation_fingerprint": {"$nin": [self.fingerprint, MANUAL_FINGERPRINT]}
+        }
+
+    async def complete_json(self, prompt: str, session_id: str) -> dict:
+        """complete() + parse_json_response(), answered from the cache when
+        this exact request has succeeded before. Only replies that parse are
+        cached, so a malformed answer is retried next time."""
+        key = self.cache and ResponseCache.key(self.provider, self.model, self.system_prompt, prompt)
+        if key:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return parse_json_response(cached)
+        response = await self.complete(prompt, session_id)
+        parsed = parse_json_response(response)
+        if key:
+            await self.cache.aput(key, response)
+        return parsed
+
+    async def complete_json_batch(self, names: list, context: str, session_id: str, retries: int = 1) -> tuple:
+        """Generate entries for several terms in one request.
+
+        context is the shared part of the prompt (e.g. candidate related
+        terms). Returns ({name: entry}, {name: failure reason}). Entries are
+        validated and cached one by one, so a malformed or missing entry only
+        sends that term again (up to `retries` times), never the whole batch.
+        """
+        results = {}
+        keys = {}
+        for name in names:
+            if self.cache:
+                keys[name] = ResponseCache.key(self.provider, self.model, self.system_prompt, "batch", name, context)
+                cached = await self.cache.aget(keys[name])
+                if cached is not None:
+                    self.stats["cache_hits"] += 1
+                    results[name] = json.loads(cached)
+        pending = [name for name in names if name not in results]
+        failures = {}
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            failures = await self._request_batch(pending, context, session_id, results, keys)
+            pending = list(failures)
+        return results, failures
+
+    async def _request_batch(self, names: list, context: str, session_id: str, results: dict, keys: dict) -> dict:
+        prompt = batch_prompt(names, context)
+        try:
+            response = await self.complete(prompt, session_id, self.expected_output_tokens * len(names))
+            entries = parse_json_response(response)
+        except json.JSONDecodeError as e:
+            return {name: f"malformed reply: {str(e)[:50]}" for name in names}
+        if isinstance(entries, dict):
+            entries = [entries]
+        if not isinstance(entries, list):
+            return {name: "reply is not a JSON array" for name in names}
+
+        by_name = {}
+        for entry in entries:
+            if isinstance(entry, dict) and isinstance(entry.get("term"), str):
+                by_name[entry["term"].strip().casefold()] = entry
+        failures = {}
+        for name in names:
+            entry = by_name.get(name.strip().casefold())
+            reason = "missing from reply" if entry is None else validate_entry(entry)
+            if reason:
+                failures[name] = reason
+                continue
+            entry.pop("term", None)
+            results[name] = entry
+            if name in keys:
+                await self.cache.aput(keys[name], json.dumps(entry))
+        return failures
+
+    async def complete(self, prompt: str, session_id: str, expected_output_tokens: Optional[int] = None) -> str:
+        expected_output_tokens = expected_output_tokens or self.expected_output_tokens
+        estimated = estimate_tokens(self.system_prompt) + estimate_tokens(prompt) + expected_output_tokens
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            self.stats["requests"] += 1
+            try:
+                response = await self.llm.send(self.system_prompt, prompt, session_id)
+            except Exception as e:
+                self.stats["errors"] += 1
+                kind = classify_error(e)
+                if kind is BudgetExceeded:
+                    raise BudgetExceeded(str(e)) from e
+                if kind is RateLimited and attempt < self.max_retries:
+                    self.stats["rate_limited"] += 1
+                    delay = self.limiter.throttled()
+                    logger.warning("Rate limited, backing off %.1fs", delay)
+                    continue
+                if kind is RateLimited:
+                    raise RateLimited(str(e)) from e
+                raise
+            actual = estimate_tokens(self.system_prompt) + estimate_tokens(prompt) + estimate_tokens(response)
+            self.limiter.settle(estimated, actual)
+            return response
+
+
+class TermLeases:
+    """Atomic, expiring claims on terms so several generator processes can
+    share one backlog without paying for the same term twice.
+
+    A claim stamps generation_lease = {worker, claimed_at, expires_at} on the
+    term with find_one_and_update, so only one worker can win it. Holders
+    extend their leases with heartbeats; a crashed worker's leases simply
+    expire and become claimable again.
+
+    Failed terms are recorded in generation_failure = {attempts, last_error,
+    last_failed_at, next_attempt_at, dead_letter}. They are not claimable
+    again until next_attempt_at (exponential backoff), and after max_attempts
+    they are dead-lettered until requeued, so a term the model cannot handle
+    stops consuming budget. Terms that failed because the provider kept
+    throttling are deferred instead, which backs off without counting an
+    attempt against them.
+    """
+
+    def __init__(self, collection, lease_seconds: int = 300, worker_id: Optional[str] = None,
+                 max_attempts: int = 5, retry_base: float = 60, retry_max: float = 6 * 3600):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    async def claim(self, query: dict, sort: Optional[list] = None) -> Optional[dict]:
+        """Lease one term matching query (the first by sort, if given), or
+        None if nothing is claimable"""
+        now = datetime.utcnow()
+        claimable = {"$or": [
+            {"generation_lease": {"$exists": False}},
+            {"generation_lease": None},
+            {"generation_lease.expires_at": {"$lt": now}}
+        ]}
+        eligible = {"$or": [
+            {"generation_failure": {"$exists": False}},
+            {"generation_failure": None},
+            {"generation_failure.dead_letter": False, "generation_failure.next_attempt_at": {"$lte": now}}
+        ]}
+        return await self.collection.find_one_and_update(
+            {"$and": [query, claimable, eligible]},
+            {"$set": {"generation_lease": {"worker": self.worker_id, "claimed_at": now, "expires_at": self._expiry()}}},
+            sort=sort,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def heartbeat(self) -> int:
+        result = await self.collection.update_many(
+            {"generation_lease.worker": self.worker_id},
+            {"$set": {"generation_lease.expires_at": self._expiry()}}
+        )
+        return result.modified_count
+
+    async def complete(self, term_id, update: dict) -> bool:
+        """Write a result, clear any failure record and drop the lease;
+        False if the lease was lost"""
+        result = await self.collection.update_one(
+            {"_id": term_id, "generation_lease.worker": self.worker_id},
+            {"$set": update, "$unset": {"generation_lease": "", "generation_failure": ""}}
+        )
+        return result.modified_count == 1
+
+    async def fail(self, term: dict, error: str) -> Optional[dict]:
+        """Record a failed attempt on a claimed term and drop the lease.
+
+        Returns the new failure record (check its dead_letter flag), or None
+        if the lease was lost.
+        """
+        now = datetime.utcnow()
+        attempts = ((term.get("generation_failure") or {}).get("attempts") or 0) + 1
+        failure = {
+            "attempts": attempts,
+            "last_error": str(error)[:500],
+            "last_failed_at": now,
+            "next_attempt_at": now + timedelta(seconds=self.retry_delay(attempts)),
+            "dead_letter": attempts >= self.max_attempts
+        }
+        result = await self.collection.update_one(
+            {"_id": term["_id"], "generation_lease.worker": self.worker_id},
+            {"$set": {"generation_failure": failure}, "$unset": {"generation_lease": ""}}
+        )
+        return failure if result.modified_count == 1 else None
+
+    async def defer(self, term: dict, error: str, delay: Optional[float] = None) -> Optional[dict]:
+        """Put a claimed term back for later without spending an attempt.
+
+        For provider-wide trouble such as throttling that says nothing about
+        the term itself. The term is not claimable again for `delay` seconds
+        (retry_base by default). Returns the failure record, or None if the
+        lease was lost.
+        """
+        now = datetime.utcnow()
+        previous = term.get("generation_failure") or {}
+        failure = {
+            "attempts": previous.get("attempts") or 0,
+            "last_error": str(error)[:500],
+            "last_failed_at": now,
+            "next_attempt_at": now + timedelta(seconds=self.retry_base if delay is None else delay),
+            "dead_letter": False
+        }
+        result = await self.collection.update_one(
+            {"_id": term["_id"], "generation_lease.worker": self.worker_id},
+            {"$set": {"generation_failure": failure}, "$unset": {"generation_lease": ""}}
+        )
+        return failure if result.modified_count == 1 else None
+
+    async def dead_letters(self) -> List[dict]:
+        """Dead-lettered terms, most recently failed first"""
+        cursor = self.collection.find(
+            {"generation_failure.dead_letter": True},
+            {"name": 1, "slug": 1, "generation_failure": 1}
+        ).sort("generation_failure.last_failed_at", -1)
+        return [term async for term in cursor]
+
+    async def requeue_dead_letters(self) -> int:
+        """Give every dead-lettered term a fresh set of attempts"""
+        result = await self.collection.update_many(
+            {"generation_failure.dead_letter": True},
+            {"$unset": {"generation_failure": ""}}
+        )
+        return result.modified_count
+
+    async def release(self, term_id=None):
+        """Give back one lease (or all of ours) without writing a result"""
+        query = {"generation_lease.worker": self.worker_id}
+        if term_id is not None:
+            query["_id"] = term_id
+        await self.collection.update_many(query, {"$unset": {"generation_lease": ""}})
+
+    @asynccontextmanager
+    async def held(self):
+        """Heartbeat while the block runs; release whatever is left on exit"""
+        async def beat():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                await self.heartbeat()
+
+        task = asyncio.create_task(beat())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            await self.release()
+
+
+async def run_workers(next_item, handle, concurrency: int):
+    """Run handle(item) on `concurrency` workers until next_item() returns None.
+
+    The first exception (e.g. BudgetExceeded) cancels the remaining workers
+    and is re-raised.
+    """
+    async def worker():
+        while True:
+            item = await next_item()
+            if item is None:
+                return
+            await handle(item)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+
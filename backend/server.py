@@ -1,23 +1,49 @@
 """BariWiki - Bariatric Surgery Encyclopedia API"""
 import os
 import re
+import gzip
 import json
+import math
+import base64
+import time
+import html
+import heapq
+import bisect
+import hashlib
+import shutil
 import asyncio
-from datetime import datetime, timedelta
+import tempfile
+import ipaddress
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Optional, List
+from urllib.parse import quote
+from xml.sax.saxutils import escape as xml_escape
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import bcrypt
 import jwt
 import pandas as pd
+from collections import Counter
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from generation import MANUAL_FINGERPRINT, GenerationClient, RateLimiter, ResponseCache, provider_from_env
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 load_dotenv()
 
@@ -27,10 +53,26 @@ DB_NAME = os.environ.get("DB_NAME", "bariwiki")
 JWT_SECRET = os.environ.get("JWT_SECRET", "bariwiki-secret")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", "60"))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+LOGIN_ATTEMPTS_PER_WINDOW = int(os.environ.get("LOGIN_ATTEMPTS_PER_WINDOW", "10"))
+LOGIN_ATTEMPT_WINDOW = int(os.environ.get("LOGIN_ATTEMPT_WINDOW", "300"))
+# Peers allowed to report the client address in X-Forwarded-For ("*" for any)
+TRUSTED_PROXIES = os.environ.get("TRUSTED_PROXIES", "127.0.0.0/8,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16")
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "BariWiki2024!")
 EMERGENT_LLM_KEY = os.environ.get("EMERGENT_LLM_KEY")
 BASE_URL = os.environ.get("BASE_URL", "https://parnellwellness.com")
+CORPUS_CACHE_TTL = int(os.environ.get("CORPUS_CACHE_TTL", "300"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "4096"))
+COUNTERS_RECONCILE_INTERVAL = int(os.environ.get("COUNTERS_RECONCILE_INTERVAL", "600"))
+HOME_CACHE_TTL = int(os.environ.get("HOME_CACHE_TTL", "30"))
+VIEW_FLUSH_INTERVAL = int(os.environ.get("VIEW_FLUSH_INTERVAL", "60"))
+RELINK_INTERVAL = int(os.environ.get("RELINK_INTERVAL", "300"))
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "1000"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", "7"))
+JOB_EVENTS_TOKEN_SECONDS = int(os.environ.get("JOB_EVENTS_TOKEN_SECONDS", "300"))
 
 # MongoDB client
 client = AsyncIOMotorClient(MONGO_URL)
@@ -39,6 +81,7 @@ db = client[DB_NAME]
 # Collections
 terms_collection = db["terms"]
 admins_collection = db["admins"]
+jobs_collection = db["jobs"]
 
 security = HTTPBearer(auto_error=False)
 
@@ -52,18 +95,104 @@ def slugify(text: str) -> str:
     return text
 
 
+def serialize_value(value):
+    """ISO strings for datetimes and str() for ObjectIds, at any depth"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: serialize_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [serialize_value(item) for item in value]
+    return value
+
+
 def serialize_doc(doc):
     """Convert MongoDB document to JSON-serializable dict"""
     if doc is None:
         return None
     doc["_id"] = str(doc["_id"])
-    # Convert datetime objects to ISO format strings
+    # Convert datetime objects (including those in embedded documents such
+    # as generation_lease) to ISO format strings
     for key, value in doc.items():
-        if isinstance(value, datetime):
-            doc[key] = value.isoformat()
+        doc[key] = serialize_value(value)
     return doc
 
 
+def encode_cursor(name: str, term_id: str) -> str:
+    """Opaque keyset cursor for the (name, _id) sort order"""
+    raw = json.dumps([name, term_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except Exception:
+        payload = None
+    # Compared against (name, _id) string keys, so anything else must not get through
+    if not (
+        isinstance(payload, list) and len(payload) == 2
+        and isinstance(payload[0], str) and isinstance(payload[1], str) and ObjectId.is_valid(payload[1])
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    name, term_id = payload
+    return name, term_id
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """Naive UTC datetime from a stored datetime or ISO string"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def term_etag(term: dict) -> str:
+    version = f"{term['_id']}:{term.get('updated_at')}:{term.get('links_updated_at')}"
+    return f'"{hashlib.sha1(version.encode()).hexdigest()[:20]}"'
+
+
+def term_last_modified(term: dict) -> Optional[datetime]:
+    """Latest of the content and related-links timestamps"""
+    stamps = [as_datetime(term.get("updated_at")), as_datetime(term.get("links_updated_at"))]
+    stamps = [stamp for stamp in stamps if stamp]
+    return max(stamps) if stamps else None
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
 def get_first_letter(name: str) -> str:
     """Get first letter of term name for A-Z navigation"""
     if not name:
@@ -72,6 +201,1299 @@ def get_first_letter(name: str) -> str:
     return first if first.isalpha() else "#"
 
 
+# Term corpus cache
+# Fields list pages (browse, category, home) actually render
+SUMMARY_FIELDS = ("_id", "name", "slug", "short_description", "category", "first_letter", "status")
+# Bookkeeping for the link graph, page views and the generator scripts
+# (leases, failure ledger), kept out of public responses; views changes on
+# every flush and would otherwise churn cached bodies and ETags
+PRIVATE_FIELDS = ("link_keys", "related_keys", "views")
+PRIVATE_PREFIX = "generation_"
+FIELDS_PATTERN = "^(full|summary)$"
+
+
+def public_fields(doc: dict) -> dict:
+    return {
+        key: value for key, value in doc.items()
+        if key not in PRIVATE_FIELDS and not key.startswith(PRIVATE_PREFIX)
+    }
+
+
+class CorpusSnapshot:
+    """Serialized terms indexed by slug, letter, category and status"""
+
+    def __init__(self, docs: list, version: int, changed_at: Optional[datetime] = None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.terms = []
+        self.by_id = {}
+        self.by_slug = {}
+        self.by_status = {}
+        self.by_letter = {}
+        self.by_category = {}
+        self.summaries = {}
+        self.stale_links = []
+        # Deletes leave no updated_at behind, so start from the last invalidation
+        self.last_modified = changed_at
+        fingerprint = hashlib.sha1()
+        for doc in docs:
+            updated_at = as_datetime(doc.get("updated_at"))
+            if updated_at and (self.last_modified is None or updated_at > self.last_modified):
+                self.last_modified = updated_at
+            fingerprint.update(f"{doc['_id']}:{updated_at}:{doc.get('status')};".encode())
+            term = serialize_doc(public_fields(doc))
+            if links_are_stale(doc):
+                # Unresolved until relink_stale_terms catches up; the
+                # frontend falls back to the raw related_terms meanwhile
+                term["related_links"] = None
+                self.stale_links.append(term["_id"])
+            self.terms.append(term)
+            self.by_id[term["_id"]] = term
+            self.summaries[term["_id"]] = {field: term.get(field) for field in SUMMARY_FIELDS}
+            self.by_slug[term["slug"]] = term
+            self.by_status.setdefault(term.get("status"), []).append(term)
+            if term.get("status") != "published":
+                continue
+            self.by_letter.setdefault(term.get("first_letter"), []).append(term)
+            # Mirror Mongo's equality match, which also hits array members
+            categories = term.get("category")
+            if not isinstance(categories, list):
+                categories = [categories]
+            for category in categories:
+                if isinstance(category, str):
+                    self.by_category.setdefault(category, []).append(term)
+        # Corpus-wide validator for aggregate routes
+        self.etag = f'"{fingerprint.hexdigest()[:20]}"'
+        self.published_position = {term["_id"]: i for i, term in enumerate(self.published)}
+
+    @property
+    def published(self) -> list:
+        return self.by_status.get("published", [])
+
+    def neighbours(self, term: dict) -> tuple:
+        """Previous and next published terms in alphabetical order"""
+        position = self.published_position.get(term["_id"])
+        if position is None:
+            return None, None
+        previous = self.published[position - 1] if position > 0 else None
+        following = self.published[position + 1] if position + 1 < len(self.published) else None
+        return (
+            self.summaries[previous["_id"]] if previous else None,
+            self.summaries[following["_id"]] if following else None,
+        )
+
+    def view(self, terms: list, fields: str) -> list:
+        """Full documents, or their precomputed summaries"""
+        if fields == "summary":
+            return [self.summaries[term["_id"]] for term in terms]
+        return terms
+
+
+class TermCorpus:
+    """Read-through, versioned in-memory copy of the terms collection.
+
+    Admin write routes call ``invalidate()``; the next public read rebuilds
+    the snapshot with a single query. The TTL bounds staleness for writes
+    made outside this process (e.g. the batch generator scripts).
+    """
+
+    def __init__(self, ttl: int = CORPUS_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self.changed_at: Optional[datetime] = None
+        self._snapshot: Optional[CorpusSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.version += 1
+        self.changed_at = datetime.utcnow()
+
+    def _is_fresh(self, snapshot: Optional[CorpusSnapshot]) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and time.monotonic() - snapshot.built_at < self.ttl
+        )
+
+    async def get(self) -> CorpusSnapshot:
+        if self._is_fresh(self._snapshot):
+            return self._snapshot
+        async with self._lock:
+            if not self._is_fresh(self._snapshot):
+                version, changed_at = self.version, self.changed_at
+                cursor = terms_collection.find({}).sort([("name", 1), ("_id", 1)])
+                docs = await cursor.to_list(length=None)
+                self._snapshot = CorpusSnapshot(docs, version, changed_at)
+            return self._snapshot
+
+
+corpus = TermCorpus()
+
+# Precompressed response cache
+MIN_COMPRESS_SIZE = 512
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=9)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=9)
+
+
+def negotiate_encoding(request: Request) -> str:
+    """Pick br, gzip or identity from Accept-Encoding"""
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = "identity", 0.0
+    for coding in ("br", "gzip"):
+        quality = accepted.get(coding, wildcard)
+        if coding in COMPRESSORS and quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Strong ETags must differ per content-coding"""
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+class CachedBody:
+    """A rendered body and its lazily built compressed variants"""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        self.variants = {"identity": body}
+
+    def encoded(self, encoding: str) -> tuple:
+        identity = self.variants["identity"]
+        if encoding == "identity" or len(identity) < MIN_COMPRESS_SIZE:
+            return identity, "identity"
+        if encoding not in self.variants:
+            self.variants[encoding] = COMPRESSORS[encoding](identity)
+        return self.variants[encoding], encoding
+
+
+response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE)
+home_cache = TTLCache(maxsize=8, ttl=HOME_CACHE_TTL)
+
+
+def render_json(content) -> bytes:
+    """Same encoding as JSONResponse"""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encoded_response(cached: CachedBody, encoding: str, headers: dict) -> Response:
+    body, encoding = cached.encoded(encoding)
+    headers = dict(headers, Vary="Accept-Encoding")
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=cached.media_type, headers=headers)
+
+
+# Materialized corpus counters
+def mongo_sort_key(value):
+    """Approximate Mongo's BSON ordering for $sort on mixed group keys"""
+    if value is None:
+        return (0, "")
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, str(value))
+
+
+def hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class CorpusCounters:
+    """Term counts by status, letter and category.
+
+    Admin write routes apply a before/after delta, so the stats, letters and
+    categories routes never touch Mongo. ``reconcile()`` recounts from the
+    collection and runs periodically to absorb writes made elsewhere (the
+    generator scripts, manual fixes).
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.letters = Counter()  # published terms only
+        self.categories = Counter()  # published terms only
+        self.all_categories = Counter()
+        self.ready = False
+        self.changed_at: Optional[datetime] = None
+        self._etag = None
+        self._lock = asyncio.Lock()
+
+    def _add(self, doc: Optional[dict], sign: int):
+        if not doc:
+            return
+        status = doc.get("status")
+        category = hashable(doc.get("category"))
+        self.statuses[status] += sign
+        self.all_categories[category] += sign
+        if status == "published":
+            self.letters[doc.get("first_letter")] += sign
+            self.categories[category] += sign
+
+    def _changed(self):
+        for counter in (self.statuses, self.letters, self.categories, self.all_categories):
+            for key in [key for key, count in counter.items() if count <= 0]:
+                del counter[key]
+        self.changed_at = datetime.utcnow()
+        self._etag = None
+
+    def apply(self, before: Optional[dict], after: Optional[dict]):
+        self._add(before, -1)
+        self._add(after, 1)
+        self._changed()
+
+    async def reconcile(self):
+        pipeline = [{"$group": {
+            "_id": {"status": "$status", "letter": "$first_letter", "category": "$category"},
+            "count": {"$sum": 1}
+        }}]
+        async with self._lock:
+            groups = [doc async for doc in terms_collection.aggregate(pipeline)]
+            fresh = CorpusCounters()
+            for group in groups:
+                key = group["_id"]
+                doc = {"status": key.get("status"), "first_letter": key.get("letter"), "category": key.get("category")}
+                fresh._add(doc, group["count"])
+            current = (self.statuses, self.letters, self.categories, self.all_categories)
+            recounted = (fresh.statuses, fresh.letters, fresh.categories, fresh.all_categories)
+            if current != recounted:
+                self.statuses, self.letters, self.categories, self.all_categories = recounted
+                self._changed()
+            self.ready = True
+
+    async def ensure_ready(self):
+        if not self.ready:
+            await self.reconcile()
+
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            state = json.dumps([self.stats(), self.letter_counts(), self.category_counts()], default=str)
+            self._etag = f'"{hashlib.sha1(state.encode()).hexdigest()[:20]}"'
+        return self._etag
+
+    def stats(self) -> dict:
+        return {
+            "total_terms": sum(self.statuses.values()),
+            "published": self.statuses.get("published", 0),
+            "drafts": self.statuses.get("draft", 0),
+            "categories": len(self.all_categories)
+        }
+
+    def letter_counts(self) -> dict:
+        return {letter: self.letters[letter] for letter in sorted(self.letters, key=mongo_sort_key)}
+
+    def category_counts(self) -> list:
+        return [
+            {"category": list(category) if isinstance(category, tuple) else category, "count": self.categories[category]}
+            for category in sorted(self.categories, key=mongo_sort_key)
+        ]
+
+
+counters = CorpusCounters()
+
+
+async def reconcile_counters_periodically():
+    while True:
+        await asyncio.sleep(COUNTERS_RECONCILE_INTERVAL)
+        try:
+            await counters.reconcile()
+        except Exception as e:
+            print(f"Counter reconciliation failed: {e}")
+
+
+# Page views, buffered in memory and flushed as one bulk $inc so term pages
+# stay read-only. Used to prioritise regeneration, not for exact analytics.
+pending_views = Counter()
+
+
+def record_view(term: dict):
+    pending_views[term["_id"]] += 1
+
+
+async def flush_views():
+    if not pending_views:
+        return
+    batch = dict(pending_views)
+    pending_views.clear()
+    await terms_collection.bulk_write(
+        [UpdateOne({"_id": ObjectId(term_id)}, {"$inc": {"views": count}}) for term_id, count in batch.items()],
+        ordered=False
+    )
+
+
+async def flush_views_periodically():
+    while True:
+        await asyncio.sleep(VIEW_FLUSH_INTERVAL)
+        try:
+            await flush_views()
+        except Exception as e:
+            print(f"View count flush failed: {e}")
+
+
+def record_term_change(before: Optional[dict], after: Optional[dict]):
+    """Propagate one admin write to the in-memory read models"""
+    corpus.invalidate()
+    counters.apply(before, after)
+
+
+# Sitemap
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_CHUNK_BYTES = 64 * 1024
+URLSET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"\n'
+    '        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
+)
+URLSET_TAIL = '</urlset>'
+
+
+def sitemap_url(loc: str, changefreq: str, priority: str, lastmod: Optional[str] = None) -> str:
+    lastmod_tag = f"\n    <lastmod>{lastmod}</lastmod>" if lastmod else ""
+    return f'''  <url>
+    <loc>{xml_escape(loc)}</loc>{lastmod_tag}
+    <changefreq>{changefreq}</changefreq>
+    <priority>{priority}</priority>
+  </url>\n'''
+
+
+class SitemapPlan:
+    """Sitemap <url> entries split into shards within protocol limits"""
+
+    def __init__(self, snapshot: CorpusSnapshot):
+        site_updated = (snapshot.last_modified or datetime.utcnow()).strftime("%Y-%m-%d")
+        entries = [
+            (sitemap_url(f"{BASE_URL}/", "daily", "1.0", site_updated), site_updated),
+            (sitemap_url(f"{BASE_URL}/resources", "weekly", "0.8", site_updated), site_updated),
+            (sitemap_url(f"{BASE_URL}/disclaimer", "monthly", "0.5", site_updated), site_updated),
+        ]
+        for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+            entries.append((sitemap_url(f"{BASE_URL}/browse/{letter.lower()}", "weekly", "0.8"), None))
+        for category in sorted(snapshot.by_category):
+            loc = f"{BASE_URL}/category/{quote(category)}"
+            entries.append((sitemap_url(loc, "weekly", "0.7"), None))
+        for term in snapshot.published:
+            lastmod = (as_datetime(term.get("updated_at")) or datetime.utcnow()).strftime("%Y-%m-%d")
+            loc = f"{BASE_URL}/wiki/{term['slug']}"
+            entries.append((sitemap_url(loc, "monthly", "0.6", lastmod), lastmod))
+
+        budget = SITEMAP_MAX_BYTES - len(URLSET_HEAD) - len(URLSET_TAIL)
+        self.shards = [[]]
+        self.shard_lastmods = [None]
+        size = 0
+        for entry, lastmod in entries:
+            shard = self.shards[-1]
+            entry_size = len(entry.encode("utf-8"))
+            if shard and (len(shard) >= SITEMAP_MAX_URLS or size + entry_size > budget):
+                self.shards.append([])
+                self.shard_lastmods.append(None)
+                shard, size = self.shards[-1], 0
+            shard.append(entry)
+            size += entry_size
+            if lastmod and (self.shard_lastmods[-1] or "") < lastmod:
+                self.shard_lastmods[-1] = lastmod
+
+    def index_xml(self) -> str:
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        ]
+        for number, lastmod in enumerate(self.shard_lastmods, start=1):
+            lastmod_tag = f"\n    <lastmod>{lastmod}</lastmod>" if lastmod else ""
+            parts.append(f"  <sitemap>\n    <loc>{BASE_URL}/api/sitemap-{number}.xml</loc>{lastmod_tag}\n  </sitemap>\n")
+        parts.append('</sitemapindex>')
+        return "".join(parts)
+
+
+sitemap_plans = LRUCache(maxsize=2)
+
+
+def sitemap_plan(snapshot: CorpusSnapshot) -> SitemapPlan:
+    plan = sitemap_plans.get(snapshot.etag)
+    if plan is None:
+        plan = sitemap_plans[snapshot.etag] = SitemapPlan(snapshot)
+    return plan
+
+
+def iter_urlset(entries: List[str], on_complete):
+    """Yield a <urlset> in ~64KB chunks, then hand the full body to on_complete"""
+    body = []
+    buffer = [URLSET_HEAD]
+    buffered = len(URLSET_HEAD)
+    for entry in entries:
+        buffer.append(entry)
+        buffered += len(entry)
+        if buffered >= SITEMAP_CHUNK_BYTES:
+            chunk = "".join(buffer).encode("utf-8")
+            body.append(chunk)
+            yield chunk
+            buffer, buffered = [], 0
+    buffer.append(URLSET_TAIL)
+    chunk = "".join(buffer).encode("utf-8")
+    body.append(chunk)
+    yield chunk
+    on_complete(b"".join(body))
+
+
+# Admin list totals, keyed by corpus version so any admin write resets them
+admin_count_cache = TTLCache(maxsize=256, ttl=60)
+
+
+async def count_terms(query: dict) -> int:
+    key = (corpus.version, json.dumps(query, sort_keys=True, default=str))
+    if key not in admin_count_cache:
+        admin_count_cache[key] = await terms_collection.count_documents(query)
+    return admin_count_cache[key]
+
+
+# Search index
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens of plain text or HTML"""
+    if not isinstance(text, str) or not text:
+        return []
+    text = html.unescape(TAG_RE.sub(" ", text))
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """BM25F inverted index over the published terms.
+
+    Each field is scored with its own length normalisation and weight, so a
+    hit in the term name outranks the same word buried in the description.
+    ``sync()`` diffs a corpus snapshot against what is already indexed and
+    only re-tokenizes terms whose ``updated_at`` changed.
+
+    The last query token also matches as a prefix ("gastr" finds gastric
+    and gastrectomy) through a sorted copy of the vocabulary, at a lower
+    weight than a whole-word hit, so partial and search-as-you-type
+    queries still find something.
+    """
+
+    FIELDS = ("name", "short_description", "description")
+    WEIGHTS = (5.0, 2.0, 1.0)
+    K1 = 1.2
+    B = 0.75
+    NAME_EXACT_BOOST = 10.0
+    NAME_PREFIX_BOOST = 3.0
+    PREFIX_WEIGHT = 0.5
+    MIN_PREFIX_LENGTH = 2
+    MAX_EXPANSIONS = 50
+
+    def __init__(self):
+        self.postings = {}  # token -> {term_id: (tf per field)}
+        self._vocabulary = None  # sorted postings keys, rebuilt on demand
+        self.docs = {}  # term_id -> term
+        self._signatures = {}
+        self._doc_tokens = {}
+        self._lengths = {}
+        self._names = {}
+        self._total_lengths = [0] * len(self.FIELDS)
+        self._snapshot = None
+
+    def sync(self, snapshot: CorpusSnapshot):
+        if snapshot is self._snapshot:
+            return
+        current = {term["_id"]: term for term in snapshot.published}
+        for term_id in list(self.docs):
+            term = current.get(term_id)
+            if term is None or term.get("updated_at") != self._signatures[term_id]:
+                self.remove(term_id)
+        for term_id, term in current.items():
+            if term_id in self.docs:
+                # Unchanged content, but keep the newest serialized copy
+                self.docs[term_id] = term
+            else:
+                self.add(term)
+        self._snapshot = snapshot
+
+    def add(self, term: dict):
+        term_id = term["_id"]
+        field_tokens = [tokenize(term.get(field)) for field in self.FIELDS]
+        counts = {}
+        for i, tokens in enumerate(field_tokens):
+            for token in tokens:
+                tf = counts.setdefault(token, [0] * len(self.FIELDS))
+                tf[i] += 1
+        for token, tf in counts.items():
+            if token not in self.postings:
+                self._vocabulary = None
+            self.postings.setdefault(token, {})[term_id] = tuple(tf)
+        lengths = [len(tokens) for tokens in field_tokens]
+        for i, length in enumerate(lengths):
+            self._total_lengths[i] += length
+        self.docs[term_id] = term
+        self._signatures[term_id] = term.get("updated_at")
+        self._doc_tokens[term_id] = list(counts)
+        self._lengths[term_id] = lengths
+        self._names[term_id] = " ".join(field_tokens[0])
+
+    def remove(self, term_id: str):
+        for token in self._doc_tokens.pop(term_id, []):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(term_id, None)
+            if not postings:
+                del self.postings[token]
+                self._vocabulary = None
+        for i, length in enumerate(self._lengths.pop(term_id, [])):
+            self._total_lengths[i] -= length
+        self.docs.pop(term_id, None)
+        self._names.pop(term_id, None)
+        self._signatures.pop(term_id, None)
+
+    def expansions(self, prefix: str) -> List[str]:
+        """Indexed tokens that extend prefix, most widely used first"""
+        if len(prefix) < self.MIN_PREFIX_LENGTH:
+            return []
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        i = bisect.bisect_right(vocabulary, prefix)
+        matches = []
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            matches.append(vocabulary[i])
+            i += 1
+        return heapq.nlargest(self.MAX_EXPANSIONS, matches, key=lambda token: len(self.postings[token]))
+
+    def _token_scores(self, token: str, n_docs: int, avg_lengths: list) -> dict:
+        postings = self.postings.get(token)
+        if not postings:
+            return {}
+        idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        scores = {}
+        for term_id, tf in postings.items():
+            lengths = self._lengths[term_id]
+            weighted_tf = 0.0
+            for i, count in enumerate(tf):
+                if count:
+                    norm = 1 - self.B + self.B * lengths[i] / avg_lengths[i]
+                    weighted_tf += self.WEIGHTS[i] * count / norm
+            scores[term_id] = idf * weighted_tf * (self.K1 + 1) / (weighted_tf + self.K1)
+        return scores
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        n_docs = len(self.docs)
+        if not tokens or not n_docs:
+            return []
+        avg_lengths = [max(total / n_docs, 1.0) for total in self._total_lengths]
+        scores = {}
+        for token in tokens[:-1]:
+            for term_id, score in self._token_scores(token, n_docs, avg_lengths).items():
+                scores[term_id] = scores.get(term_id, 0.0) + score
+        # The last token counts once per term: its whole-word score or its
+        # best (down-weighted) prefix expansion, whichever is higher
+        last = self._token_scores(tokens[-1], n_docs, avg_lengths)
+        for token in self.expansions(tokens[-1]):
+            for term_id, score in self._token_scores(token, n_docs, avg_lengths).items():
+                last[term_id] = max(last.get(term_id, 0.0), self.PREFIX_WEIGHT * score)
+        for term_id, score in last.items():
+            scores[term_id] = scores.get(term_id, 0.0) + score
+
+        normalized_query = " ".join(tokens)
+        for term_id in scores:
+            name = self._names[term_id]
+            if name == normalized_query:
+                scores[term_id] += self.NAME_EXACT_BOOST
+            elif name.startswith(normalized_query):
+                scores[term_id] += self.NAME_PREFIX_BOOST
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [self.docs[term_id] for term_id, _ in ranked]
+
+
+search_index = SearchIndex()
+
+
+# Autocomplete index
+ALIAS_RE = re.compile(r"\(([^)]*)\)")
+
+
+def name_variants(name: str) -> List[str]:
+    """Normalized name plus aliases listed in parentheses.
+
+    "Adjustable Gastric Band (AGB; lap-band)" yields "adjustable gastric band",
+    "agb" and "lap band".
+    """
+    variants = [" ".join(tokenize(ALIAS_RE.sub(" ", name)))]
+    for group in ALIAS_RE.findall(name):
+        variants.extend(" ".join(tokenize(alias)) for alias in re.split(r"[;,]", group))
+    return [v for v in dict.fromkeys(variants) if v]
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over published term names.
+
+    Keys live in three tiers: full names, parenthetical aliases and word
+    starts inside a name ("bypass" -> "Gastric Bypass"). Each tier is a
+    sorted list searched with ``bisect``, so a lookup costs O(log n + k).
+    """
+
+    NAME, ALIAS, WORD = range(3)
+
+    def __init__(self):
+        self.tiers = ([], [], [])
+        self.keys = ([], [], [])
+        self._snapshot = None
+
+    def sync(self, snapshot: CorpusSnapshot):
+        if snapshot is self._snapshot:
+            return
+        tiers = ([], [], [])
+        for term in snapshot.published:
+            name = term.get("name") or ""
+            entry = (name, term["slug"])
+            variants = name_variants(name)
+            if not variants:
+                continue
+            tiers[self.NAME].append((variants[0], entry))
+            for alias in variants[1:]:
+                tiers[self.ALIAS].append((alias, entry))
+            words = variants[0].split(" ")
+            for i in range(1, len(words)):
+                tiers[self.WORD].append((" ".join(words[i:]), entry))
+        for tier in tiers:
+            tier.sort()
+        self.tiers = tiers
+        self.keys = tuple([key for key, _ in tier] for tier in tiers)
+        self._snapshot = snapshot
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[dict]:
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        for keys, tier in zip(self.keys, self.tiers):
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                name, slug = tier[i][1]
+                if slug not in seen:
+                    seen.add(slug)
+                    results.append({"name": name, "slug": slug})
+                    if len(results) >= limit:
+                        return results
+                i += 1
+        return results
+
+
+prefix_index = PrefixIndex()
+
+
+# Typo-tolerant lookup
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance.
+
+    Returns ``max_distance + 1`` as soon as the distance is known to exceed
+    ``max_distance``.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(word: str) -> set:
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """Trigram index over the vocabulary of published term names.
+
+    Candidate words are those sharing trigrams with the misspelled word,
+    read from posting lists, so only a handful of names ever reach the edit
+    distance check. Hyphenated name parts are also indexed joined together
+    ("rouxeny" -> "roux en y").
+    """
+
+    MIN_WORD_LENGTH = 4
+    MAX_CANDIDATES = 20
+    MIN_SIMILARITY = 0.3
+
+    def __init__(self):
+        self.vocabulary = {}  # key -> (replacement, frequency)
+        self.keys = []  # sorted vocabulary keys, for prefix checks
+        self.postings = {}  # trigram -> [key]
+        self._snapshot = None
+
+    def sync(self, snapshot: CorpusSnapshot):
+        if snapshot is self._snapshot:
+            return
+        vocabulary = {}
+        for term in snapshot.published:
+            for part in (term.get("name") or "").split():
+                tokens = tokenize(part)
+                entries = [(token, token) for token in tokens]
+                if len(tokens) > 1:
+                    entries.append(("".join(tokens), " ".join(tokens)))
+                for key, replacement in entries:
+                    _, frequency = vocabulary.get(key, (replacement, 0))
+                    vocabulary[key] = (replacement, frequency + 1)
+        postings = {}
+        for key in vocabulary:
+            if len(key) >= self.MIN_WORD_LENGTH:
+                for gram in trigrams(key):
+                    postings.setdefault(gram, []).append(key)
+        self.vocabulary = vocabulary
+        self.keys = sorted(vocabulary)
+        self.postings = postings
+        self._snapshot = snapshot
+
+    def is_prefix(self, word: str) -> bool:
+        position = bisect.bisect_left(self.keys, word)
+        return position < len(self.keys) and self.keys[position].startswith(word)
+
+    def correct_word(self, word: str) -> str:
+        if word in self.vocabulary or len(word) < self.MIN_WORD_LENGTH:
+            return self.vocabulary.get(word, (word, 0))[0]
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for key in self.postings.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        candidates = []
+        for key, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(key) + 2)
+            if similarity >= self.MIN_SIMILARITY:
+                candidates.append((similarity, key))
+        max_distance = 1 if len(word) < 6 else 2
+        best = None
+        for _, key in heapq.nlargest(self.MAX_CANDIDATES, candidates):
+            distance = edit_distance(word, key, max_distance)
+            if distance > max_distance:
+                continue
+            rank = (distance, -self.vocabulary[key][1], key)
+            if best is None or rank < best:
+                best = rank
+        return self.vocabulary[best[2]][0] if best else word
+
+    def did_you_mean(self, query: str) -> Optional[str]:
+        tokens = tokenize(query)
+        corrected = [self.correct_word(token) for token in tokens[:-1]]
+        # Search matches the last token as a prefix, so a word still being
+        # typed ("gastr") is not a misspelling
+        if tokens:
+            last = tokens[-1]
+            corrected.append(last if self.is_prefix(last) else self.correct_word(last))
+        corrected = " ".join(corrected)
+        return corrected if corrected != " ".join(tokens) else None
+
+
+fuzzy_index = FuzzyIndex()
+# Queries with at least this many hits are taken as spelled correctly
+FUZZY_MAX_HITS = 3
+
+
+# Related-terms graph
+def link_keys(name: str) -> List[str]:
+    """Normalized keys a term answers to: full name, bare name, aliases"""
+    if not isinstance(name, str):
+        return []
+    full = " ".join(tokenize(name))
+    return [key for key in dict.fromkeys([full] + name_variants(name)) if key]
+
+
+def link_entry(term: dict) -> dict:
+    return {"term_id": str(term["_id"]), "name": term["name"], "slug": term["slug"]}
+
+
+def best_link(related_name: str, candidates: List[dict], exclude_id=None) -> Optional[dict]:
+    """Closest candidate for a related name.
+
+    Exact full-name matches win over bare-name and alias matches; ties go
+    to the shorter (more general) term name.
+    """
+    wanted = link_keys(related_name)
+    best, best_rank = None, None
+    for candidate in candidates:
+        if candidate["_id"] == exclude_id:
+            continue
+        keys = candidate.get("link_keys") or link_keys(candidate.get("name"))
+        for i, key in enumerate(wanted):
+            if key in keys:
+                rank = (i + keys.index(key), len(candidate["name"]))
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = candidate, rank
+    return best
+
+
+def resolve_links(term: dict, candidates_by_key: dict) -> List[dict]:
+    links = []
+    seen = set()
+    for related_name in term.get("related_terms") or []:
+        candidates = []
+        for key in link_keys(related_name):
+            candidates.extend(candidates_by_key.get(key, []))
+        target = best_link(related_name, candidates, term["_id"])
+        if target is not None and target["_id"] not in seen:
+            seen.add(target["_id"])
+            links.append(link_entry(target))
+    return links
+
+
+def related_keys(term: dict) -> List[str]:
+    keys = []
+    for related_name in term.get("related_terms") or []:
+        keys.extend(link_keys(related_name))
+    return list(dict.fromkeys(keys))
+
+
+def links_are_stale(term: dict) -> bool:
+    """related_terms changed without going through update_forward_links"""
+    return (term.get("related_keys") or []) != related_keys(term)
+
+
+async def update_forward_links(term: dict):
+    """Re-resolve one term's related_terms and move its backlinks to match"""
+    keys = related_keys(term)
+    candidates_by_key = {}
+    if keys:
+        cursor = terms_collection.find({"link_keys": {"$in": keys}}, {"name": 1, "slug": 1, "link_keys": 1})
+        async for candidate in cursor:
+            for key in candidate.get("link_keys") or []:
+                candidates_by_key.setdefault(key, []).append(candidate)
+    links = resolve_links(term, candidates_by_key)
+    # Link changes get their own timestamp so term ETags move without
+    # touching the editorial updated_at
+    now = datetime.utcnow()
+    await terms_collection.update_one(
+        {"_id": term["_id"]},
+        {"$set": {"related_links": links, "related_keys": keys, "links_updated_at": now}}
+    )
+    # Pull from every old target and re-add to every new one, so a renamed
+    # source also refreshes the name/slug stored in its backlinks
+    old_ids = [ObjectId(link["term_id"]) for link in term.get("related_links") or []]
+    if old_ids:
+        await terms_collection.update_many(
+            {"_id": {"$in": old_ids}},
+            {"$pull": {"backlinks": {"term_id": str(term["_id"])}}, "$set": {"links_updated_at": now}}
+        )
+    if links:
+        await terms_collection.update_many(
+            {"_id": {"$in": [ObjectId(link["term_id"]) for link in links]}},
+            {"$push": {"backlinks": link_entry(term)}, "$set": {"links_updated_at": now}}
+        )
+    corpus.invalidate()
+
+
+async def relink_referrers(keys: List[str], term_ids: List[ObjectId] = ()):
+    """Re-resolve terms whose related names may now point elsewhere"""
+    clauses = []
+    if keys:
+        clauses.append({"related_keys": {"$in": list(keys)}})
+    if term_ids:
+        clauses.append({"_id": {"$in": list(term_ids)}})
+    if not clauses:
+        return
+    projection = {"name": 1, "slug": 1, "related_terms": 1, "related_links": 1}
+    referrers = await terms_collection.find({"$or": clauses}, projection).to_list(length=None)
+    for referrer in referrers:
+        await update_forward_links(referrer)
+
+
+async def relink_stale_terms() -> int:
+    """Re-resolve terms whose related_terms were rewritten outside the
+    admin routes (the generator scripts), as flagged by the last snapshot"""
+    snapshot = await corpus.get()
+    projection = {"name": 1, "slug": 1, "related_terms": 1, "related_keys": 1, "related_links": 1}
+    relinked = 0
+    for term_id in snapshot.stale_links:
+        term = await terms_collection.find_one({"_id": ObjectId(term_id)}, projection)
+        if term is None or not links_are_stale(term):
+            continue
+        # Swap related_keys first so that, with several server processes,
+        # only one of them moves this term's backlinks
+        claimed = await terms_collection.update_one(
+            {"_id": term["_id"], "related_keys": term.get("related_keys")},
+            {"$set": {"related_keys": related_keys(term)}}
+        )
+        if claimed.modified_count:
+            await update_forward_links(term)
+            relinked += 1
+    return relinked
+
+
+async def relink_stale_terms_periodically():
+    while True:
+        await asyncio.sleep(RELINK_INTERVAL)
+        try:
+            await relink_stale_terms()
+        except Exception as e:
+            print(f"Related-terms relink failed: {e}")
+
+
+async def unlink_deleted_term(term: dict):
+    targets = [ObjectId(link["term_id"]) for link in term.get("related_links") or []]
+    if targets:
+        await terms_collection.update_many(
+            {"_id": {"$in": targets}},
+            {"$pull": {"backlinks": {"term_id": str(term["_id"])}}, "$set": {"links_updated_at": datetime.utcnow()}}
+        )
+    sources = [ObjectId(link["term_id"]) for link in term.get("backlinks") or []]
+    await relink_referrers([], sources)
+
+
+async def rebuild_link_graph() -> int:
+    """Recompute link keys, forward links and backlinks for every term"""
+    projection = {"name": 1, "slug": 1, "related_terms": 1}
+    terms = await terms_collection.find({}, projection).to_list(length=None)
+    candidates_by_key = {}
+    for term in terms:
+        term["link_keys"] = link_keys(term.get("name"))
+        for key in term["link_keys"]:
+            candidates_by_key.setdefault(key, []).append(term)
+    backlinks = {term["_id"]: [] for term in terms}
+    forward = {}
+    for term in terms:
+        forward[term["_id"]] = resolve_links(term, candidates_by_key)
+        for link in forward[term["_id"]]:
+            backlinks[ObjectId(link["term_id"])].append(link_entry(term))
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne({"_id": term["_id"]}, {"$set": {
+            "link_keys": term["link_keys"],
+            "related_keys": related_keys(term),
+            "related_links": forward[term["_id"]],
+            "backlinks": backlinks[term["_id"]],
+            "links_updated_at": now
+        }})
+        for term in terms
+    ]
+    if operations:
+        await terms_collection.bulk_write(operations, ordered=False)
+    corpus.invalidate()
+    return len(operations)
+
+
+# Bulk import
+def iter_import_cells(filename: str, fileobj):
+    """Yield (row number, first-column value) from an uploaded sheet.
+
+    Every row counts, including the first: the original template has no
+    header, so its first cell is a term like any other.
+    """
+    if filename.endswith('.csv'):
+        row = 0
+        for frame in pd.read_csv(fileobj, header=None, usecols=[0], chunksize=IMPORT_CHUNK_SIZE,
+                                 skip_blank_lines=False):
+            for value in frame.iloc[:, 0]:
+                row += 1
+                yield row, value
+    elif filename.endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            for row, cells in enumerate(workbook.active.iter_rows(max_col=1, values_only=True), start=1):
+                yield row, cells[0] if cells else None
+        finally:
+            workbook.close()
+    else:
+        # Legacy .xls has no streaming reader
+        frame = pd.read_excel(fileobj, header=None, usecols=[0])
+        for row, value in enumerate(frame.iloc[:, 0], start=1):
+            yield row, value
+
+
+def iter_import_chunks(filename: str, fileobj):
+    chunk = []
+    for row, value in iter_import_cells(filename, fileobj):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        chunk.append((row, value))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def new_draft_term(term_name: str, slug: str) -> dict:
+    now = datetime.utcnow()
+    return {
+        "name": term_name,
+        "slug": slug,
+        "description": "",
+        "short_description": "",
+        "category": "Uncategorized",
+        "related_terms": [],
+        "authority_links": [],
+        "first_letter": get_first_letter(term_name),
+        "link_keys": link_keys(term_name),
+        "status": "draft",
+        "meta_title": f"{term_name} - BariWiki",
+        "meta_description": f"Learn about {term_name} in bariatric surgery.",
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+async def import_chunk(chunk: list, seen_slugs: set) -> tuple:
+    """Insert one parsed chunk; returns (per-row outcomes, inserted terms)"""
+    outcomes = []
+    pending = []
+    for row, value in chunk:
+        outcome = {"row": row, "name": str(value).strip()}
+        outcomes.append(outcome)
+        if not isinstance(value, str) or not value.strip():
+            outcome.update(status="invalid", reason="Not a text term name")
+            continue
+        slug = slugify(value.strip())
+        outcome["slug"] = slug
+        if not slug:
+            outcome.update(status="invalid", reason="Name has no usable characters")
+        elif slug in seen_slugs:
+            outcome.update(status="duplicate", reason="Repeated in this file")
+        else:
+            seen_slugs.add(slug)
+            pending.append((outcome, new_draft_term(value.strip(), slug)))
+
+    existing = set()
+    if pending:
+        cursor = terms_collection.find({"slug": {"$in": [term["slug"] for _, term in pending]}}, {"slug": 1})
+        existing = {doc["slug"] async for doc in cursor}
+    to_insert = []
+    for outcome, term in pending:
+        if term["slug"] in existing:
+            outcome.update(status="duplicate", reason="Already exists")
+        else:
+            to_insert.append((outcome, term))
+
+    inserted = []
+    if to_insert:
+        # Upserts keyed on slug keep a concurrent import of the same name from
+        # creating a second document between the check above and this write
+        result = await terms_collection.bulk_write(
+            [UpdateOne({"slug": term["slug"]}, {"$setOnInsert": term}, upsert=True) for _, term in to_insert],
+            ordered=False
+        )
+        upserted_ids = result.upserted_ids
+        for index, (outcome, term) in enumerate(to_insert):
+            if index in upserted_ids:
+                term["_id"] = upserted_ids[index]
+                outcome.update(status="imported", term_id=str(term["_id"]))
+                inserted.append(term)
+            else:
+                outcome.update(status="duplicate", reason="Already exists")
+    return outcomes, inserted
+
+
+async def import_upload(filename: str, fileobj, report) -> dict:
+    """Import every term in an uploaded sheet, reporting progress per chunk"""
+    rows = []
+    new_keys = []
+    seen_slugs = set()
+    try:
+        async for chunk in iterate_in_threadpool(iter_import_chunks(filename, fileobj)):
+            outcomes, inserted = await import_chunk(chunk, seen_slugs)
+            rows.extend(outcomes)
+            for term in inserted:
+                record_term_change(None, term)
+                new_keys.extend(term["link_keys"])
+            await report(len(rows), message=f"{len(rows)} rows processed")
+    except pd.errors.EmptyDataError:
+        pass
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    # New names may resolve related terms that were dangling until now
+    await relink_referrers(new_keys)
+    totals = Counter(row["status"] for row in rows)
+    imported, duplicates, invalid = totals["imported"], totals["duplicate"], totals["invalid"]
+    return {
+        "message": f"Import complete: {imported} terms imported, {duplicates} skipped (duplicates), {invalid} invalid",
+        "imported": imported,
+        "skipped": duplicates,
+        "duplicates": duplicates,
+        "invalid": invalid,
+        "rows": rows
+    }
+
+
+# AI generation: one backoff state for every job, and the on-disk reply
+# cache shared with the generator scripts
+generation_limiter = RateLimiter()
+llm_cache = ResponseCache.from_env()
+llm_provider = provider_from_env(EMERGENT_LLM_KEY)
+
+
+# Background jobs
+# Slow admin work (imports, AI generation) runs on JOB_WORKERS asyncio
+# workers instead of inside the request. Job state lives in the jobs
+# collection so it can be polled; job_events wakes SSE streams in this
+# process as soon as a job changes.
+TERMINAL_JOB_STATES = ("completed", "failed")
+job_queue = asyncio.Queue()
+job_handlers = {}
+job_events = {}
+
+
+def job_handler(kind: str):
+    def register(func):
+        job_handlers[kind] = func
+        return func
+    return register
+
+
+def parse_job_id(job_id: str) -> ObjectId:
+    try:
+        return ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+
+def serialize_job(job: dict) -> dict:
+    job = serialize_doc({key: value for key, value in job.items() if key != "payload"})
+    job["job_id"] = job["_id"]
+    return job
+
+
+def queued_response(job: dict, message: str) -> JSONResponse:
+    return JSONResponse(status_code=202, content={
+        "message": message,
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "events_token": create_job_events_token(job["_id"])
+    })
+
+
+def job_changed(job_id: ObjectId) -> asyncio.Event:
+    return job_events.setdefault(job_id, asyncio.Event())
+
+
+async def update_job(job_id: ObjectId, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    await jobs_collection.update_one({"_id": job_id}, {"$set": fields})
+    event = job_events.pop(job_id, None)
+    if event:
+        event.set()
+
+
+async def submit_job(kind: str, payload: dict, admin: dict) -> dict:
+    now = datetime.utcnow()
+    job = {
+        "kind": kind,
+        "status": "queued",
+        "payload": payload,
+        "progress": {"done": 0, "total": None, "message": "Queued"},
+        "result": None,
+        "error": None,
+        "created_by": admin["username"],
+        "created_at": now,
+        "updated_at": now
+    }
+    await jobs_collection.insert_one(job)
+    await job_queue.put(job["_id"])
+    return job
+
+
+async def run_job(job_id: ObjectId):
+    now = datetime.utcnow()
+    job = await jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "running", "started_at": now, "updated_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        return
+    job_events.pop(job_id, asyncio.Event()).set()
+
+    async def report(done: int, total: Optional[int] = None, message: Optional[str] = None):
+        await update_job(job_id, progress={"done": done, "total": total, "message": message})
+
+    try:
+        result = await job_handlers[job["kind"]](job, report)
+    except HTTPException as e:
+        await update_job(job_id, status="failed", error=e.detail, finished_at=datetime.utcnow())
+    except Exception as e:
+        await update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+    else:
+        await update_job(job_id, status="completed", result=result, finished_at=datetime.utcnow())
+
+
+async def job_worker():
+    while True:
+        job_id = await job_queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            print(f"Job {job_id} could not be run: {e}")
+        finally:
+            job_queue.task_done()
+
+
+async def resume_jobs():
+    """Fail jobs cut off by a restart and queue the ones that never started"""
+    now = datetime.utcnow()
+    await jobs_collection.update_many(
+        {"status": "running"},
+        {"$set": {"status": "failed", "error": "Interrupted by a server restart", "finished_at": now, "updated_at": now}}
+    )
+    async for job in jobs_collection.find({"status": "queued"}, {"_id": 1}).sort("created_at", 1):
+        await job_queue.put(job["_id"])
+
+
+async def job_event_stream(job_id: ObjectId):
+    """Server-Sent Events: one message per job state change until it finishes"""
+    last = None
+    while True:
+        changed = job_changed(job_id)
+        job = await jobs_collection.find_one({"_id": job_id})
+        if job is None or job["status"] in TERMINAL_JOB_STATES:
+            # Nothing will set the event again, so don't leave it behind
+            if job_events.get(job_id) is changed:
+                del job_events[job_id]
+        if job is None:
+            return
+        data = json.dumps(serialize_job(job), default=str)
+        if data != last:
+            last = data
+            yield f"data: {data}\n\n"
+        if job["status"] in TERMINAL_JOB_STATES:
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=15)
+        except asyncio.TimeoutError:
+            # Keeps proxies from closing an idle stream; the re-read also
+            # picks up changes made by other processes
+            yield ": keepalive\n\n"
+
+
 # Pydantic Models
 class TermCreate(BaseModel):
     name: str
@@ -113,24 +1535,48 @@ async def lifespan(app: FastAPI):
     # Startup: Create indexes and default admin
     await terms_collection.create_index("slug", unique=True)
     await terms_collection.create_index("name")
+    await terms_collection.create_index([("name", 1), ("_id", 1)])
+    await terms_collection.create_index([("status", 1), ("name", 1), ("_id", 1)])
     await terms_collection.create_index("first_letter")
     await terms_collection.create_index("category")
     await terms_collection.create_index("status")
+    await terms_collection.create_index("link_keys")
+    await terms_collection.create_index("related_keys")
     await terms_collection.create_index([("name", "text"), ("description", "text")])
+    await jobs_collection.create_index("status")
+    await jobs_collection.create_index("finished_at", expireAfterSeconds=JOB_RETENTION_DAYS * 86400)
     
     # Create default admin if not exists
     admin = await admins_collection.find_one({"username": ADMIN_USERNAME})
     if not admin:
-        hashed = bcrypt.hashpw(ADMIN_PASSWORD.encode(), bcrypt.gensalt())
+        hashed = await hash_password(ADMIN_PASSWORD)
         await admins_collection.insert_one({
             "username": ADMIN_USERNAME,
-            "password_hash": hashed.decode(),
+            "password_hash": hashed,
             "created_at": datetime.utcnow()
         })
+        invalidate_admin(ADMIN_USERNAME)
         print(f"Default admin created: {ADMIN_USERNAME}")
     
+    if await terms_collection.count_documents({"link_keys": {"$exists": False}}, limit=1):
+        print(f"Related-terms graph rebuilt for {await rebuild_link_graph()} terms")
+    
+    await counters.reconcile()
+    reconcile_task = asyncio.create_task(reconcile_counters_periodically())
+    views_task = asyncio.create_task(flush_views_periodically())
+    relink_task = asyncio.create_task(relink_stale_terms_periodically())
+    await resume_jobs()
+    job_workers = [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+    
     yield
     # Shutdown
+    reconcile_task.cancel()
+    views_task.cancel()
+    relink_task.cancel()
+    await flush_views()
+    for worker in job_workers:
+        worker.cancel()
+    password_executor.shutdown(wait=False)
     client.close()
 
 
@@ -146,34 +1592,157 @@ app.add_middleware(
 
 
 # Auth helpers
+
+# bcrypt is deliberately slow CPU work, so it runs on a small dedicated pool
+# instead of the event loop; the semaphore keeps callers from queueing up
+# more work than the pool can drain.
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+# Recent login attempt times per (client IP, username)
+login_attempts = TTLCache(maxsize=10000, ttl=LOGIN_ATTEMPT_WINDOW)
+trusted_proxies = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in TRUSTED_PROXIES.split(",") if entry.strip() and entry.strip() != "*"
+]
+trust_any_proxy = "*" in [entry.strip() for entry in TRUSTED_PROXIES.split(",")]
+
+
+async def run_password_work(func, *args):
+    async with password_slots:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    hashed = await run_password_work(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+    return hashed.decode()
+
+
+async def check_password(password: str, password_hash: str) -> bool:
+    return await run_password_work(bcrypt.checkpw, password.encode(), password_hash.encode())
+
+
+def is_trusted_proxy(address: str) -> bool:
+    if trust_any_proxy:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request) -> str:
+    """The caller's address, read through X-Forwarded-For when the request
+    came from a trusted proxy (the ingress in front of the API)"""
+    peer = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    # Walk back from the nearest hop; the first untrusted one is the client
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+def throttle_login(request: Request, username: str):
+    """Reject a client that made too many login attempts within the window.
+
+    Attempts are counted per client address and username, so one client
+    guessing at an account cannot lock every other admin out.
+    """
+    key = (client_ip(request), username.casefold())
+    now = time.time()
+    attempts = [t for t in login_attempts.get(key, ()) if t > now - LOGIN_ATTEMPT_WINDOW]
+    if len(attempts) >= LOGIN_ATTEMPTS_PER_WINDOW:
+        retry_after = int(attempts[0] + LOGIN_ATTEMPT_WINDOW - now) + 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+    attempts.append(now)
+    login_attempts[key] = attempts
+
+
 def create_token(username: str) -> str:
     expiration = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
     payload = {"sub": username, "exp": expiration}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
+def create_job_events_token(job_id: ObjectId) -> str:
+    """Short-lived token that only opens the event stream of one job.
+
+    EventSource cannot send headers, so the token travels in the URL, where
+    proxies and browser history may keep it; it must not be an admin token.
+    """
+    expiration = datetime.utcnow() + timedelta(seconds=JOB_EVENTS_TOKEN_SECONDS)
+    payload = {"sub": str(job_id), "scope": "job-events", "exp": expiration}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def verify_job_events_token(token: str, job_id: ObjectId) -> bool:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return False
+    return payload.get("scope") == "job-events" and payload.get("sub") == str(job_id)
+
+
+# Verified tokens (token -> (username, exp)) and admin records by username.
+# Entries live at most ADMIN_CACHE_TTL seconds; invalidate_admin() drops
+# them immediately when an admin record changes.
+token_cache = TTLCache(maxsize=1024, ttl=ADMIN_CACHE_TTL)
+admin_cache = TTLCache(maxsize=64, ttl=ADMIN_CACHE_TTL)
+
+
+def invalidate_admin(username: str):
+    admin_cache.pop(username, None)
+    for token in [token for token, (sub, _) in list(token_cache.items()) if sub == username]:
+        token_cache.pop(token, None)
+
+
 def verify_token(token: str) -> Optional[str]:
+    cached = token_cache.get(token)
+    if cached is not None:
+        username, expires = cached
+        return username if expires is None or expires > time.time() else None
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("sub")
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    if payload.get("scope"):
+        # Job event tokens are not admin sessions
+        return None
+    username = payload.get("sub")
+    if username:
+        token_cache[token] = (username, payload.get("exp"))
+    return username
 
 
-async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    if not credentials:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    username = verify_token(credentials.credentials)
+async def authenticate_admin(token: str) -> dict:
+    username = verify_token(token)
     if not username:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    admin = await admins_collection.find_one({"username": username})
-    if not admin:
-        raise HTTPException(status_code=401, detail="Admin not found")
+    admin = admin_cache.get(username)
+    if admin is None:
+        admin = await admins_collection.find_one({"username": username})
+        if not admin:
+            raise HTTPException(status_code=401, detail="Admin not found")
+        admin_cache[username] = admin
     return admin
 
 
+async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not credentials:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await authenticate_admin(credentials.credentials)
+
+
 # Public Routes
 @app.get("/api/health")
 async def health_check():
@@ -184,17 +1753,37 @@ async def health_check():
 async def list_terms(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: str = Query("full", pattern=FIELDS_PATTERN)
 ):
-    """List all terms with pagination"""
-    skip = (page - 1) * limit
-    query = {}
-    if status:
-        query["status"] = status
+    """List all terms with pagination.
+
+    Pass ``cursor`` (empty for the first page, then each ``next_cursor``)
+    for keyset pagination on (name, _id) instead of page numbers.
+    """
+    snapshot = await corpus.get()
+    matching = snapshot.by_status.get(status, []) if status else snapshot.terms
+    total = len(matching)
+    
+    if cursor is not None:
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(
+                matching, decode_cursor(cursor), key=lambda t: (t["name"], t["_id"])
+            )
+        terms = matching[start:start + limit]
+        next_cursor = None
+        if start + limit < total:
+            next_cursor = encode_cursor(terms[-1]["name"], terms[-1]["_id"])
+        result = {"terms": snapshot.view(terms, fields), "limit": limit, "next_cursor": next_cursor}
+        if include_total:
+            result["total"] = total
+        return result
     
-    cursor = terms_collection.find(query).sort("name", 1).skip(skip).limit(limit)
-    terms = [serialize_doc(doc) async for doc in cursor]
-    total = await terms_collection.count_documents(query)
+    skip = (page - 1) * limit
+    terms = snapshot.view(matching[skip:skip + limit], fields)
     
     return {
         "terms": terms,
@@ -206,173 +1795,230 @@ async def list_terms(
 
 
 @app.get("/api/terms/letter/{letter}")
-async def get_terms_by_letter(letter: str):
+async def get_terms_by_letter(
+    letter: str,
+    fields: str = Query("full", pattern=FIELDS_PATTERN)
+):
     """Get all terms starting with a specific letter"""
     letter = letter.upper()
-    query = {"first_letter": letter, "status": "published"}
-    cursor = terms_collection.find(query).sort("name", 1)
-    terms = [serialize_doc(doc) async for doc in cursor]
+    snapshot = await corpus.get()
+    terms = snapshot.view(snapshot.by_letter.get(letter, []), fields)
     return {"letter": letter, "terms": terms, "count": len(terms)}
 
 
 @app.get("/api/terms/search")
 async def search_terms(
     q: str = Query(..., min_length=1),
-    limit: int = Query(20, ge=1, le=50)
+    limit: int = Query(20, ge=1, le=50),
+    fuzzy: bool = False
 ):
-    """Search terms by name or description"""
-    # Use text search or regex for partial matching
-    regex_pattern = {"$regex": q, "$options": "i"}
-    query = {
-        "$or": [
-            {"name": regex_pattern},
-            {"description": regex_pattern}
-        ],
-        "status": "published"
-    }
-    cursor = terms_collection.find(query).limit(limit)
-    terms = [serialize_doc(doc) async for doc in cursor]
-    return {"query": q, "terms": terms, "count": len(terms)}
+    """Search published terms, ranked by relevance.
+
+    When the query found nothing (or, with ``fuzzy``, fewer than
+    ``FUZZY_MAX_HITS`` terms) it is spell-corrected against term names and
+    a ``did_you_mean`` suggestion is offered if it looks misspelled; with
+    ``fuzzy`` the corrected results are also appended.
+    """
+    snapshot = await corpus.get()
+    search_index.sync(snapshot)
+    terms = search_index.search(q, limit)
+    did_you_mean = None
+    if not terms or (fuzzy and len(terms) < FUZZY_MAX_HITS):
+        fuzzy_index.sync(snapshot)
+        did_you_mean = fuzzy_index.did_you_mean(q)
+    if fuzzy and did_you_mean and len(terms) < limit:
+        seen = {term["_id"] for term in terms}
+        for term in search_index.search(did_you_mean, limit):
+            if term["_id"] not in seen and len(terms) < limit:
+                terms.append(term)
+    return {"query": q, "terms": terms, "count": len(terms), "did_you_mean": did_you_mean}
+
+
+@app.get("/api/terms/suggest")
+async def suggest_terms(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Autocomplete term names and aliases by prefix"""
+    snapshot = await corpus.get()
+    prefix_index.sync(snapshot)
+    suggestions = prefix_index.suggest(q, limit)
+    return {"query": q, "suggestions": suggestions}
 
 
 @app.get("/api/terms/slug/{slug}")
-async def get_term_by_slug(slug: str):
+async def get_term_by_slug(slug: str, request: Request):
     """Get a single term by its slug"""
-    term = await terms_collection.find_one({"slug": slug})
+    snapshot = await corpus.get()
+    term = snapshot.by_slug.get(slug)
     if not term:
         raise HTTPException(status_code=404, detail="Term not found")
-    return serialize_doc(term)
+    record_view(term)
+    encoding = negotiate_encoding(request)
+    last_modified = term_last_modified(term)
+    etag = term_etag(term)
+    headers = validator_headers(variant_etag(etag, encoding), last_modified)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    key = ("term", etag)
+    cached = response_cache.get(key)
+    if cached is None:
+        cached = response_cache[key] = CachedBody(render_json(term), "application/json")
+    return encoded_response(cached, encoding, headers)
+
+
+@app.get("/api/terms/slug/{slug}/bundle")
+async def get_term_bundle(
+    slug: str,
+    request: Request,
+    siblings: int = Query(10, ge=0, le=50)
+):
+    """Everything a term page renders, in one response.
+
+    Returns the term, summaries of its resolved related terms (null if
+    they were never resolved, so clients can fall back to related_terms)
+    and backlinks, other published terms in its category and its
+    alphabetical neighbours, all from the in-memory corpus.
+    """
+    snapshot = await corpus.get()
+    term = snapshot.by_slug.get(slug)
+    if not term:
+        raise HTTPException(status_code=404, detail="Term not found")
+    record_view(term)
+    encoding = negotiate_encoding(request)
+    digest = hashlib.sha1(f"{term_etag(term)}:{snapshot.etag}:{siblings}".encode()).hexdigest()
+    etag = f'"{digest[:20]}"'
+    last_modified = max(filter(None, [term_last_modified(term), snapshot.last_modified]), default=None)
+    headers = validator_headers(variant_etag(etag, encoding), last_modified)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    key = ("bundle", etag)
+    cached = response_cache.get(key)
+    if cached is None:
+        def summaries(links):
+            return [
+                snapshot.summaries[link["term_id"]]
+                for link in links or []
+                if link["term_id"] in snapshot.summaries
+            ]
+
+        category = term.get("category")
+        members = snapshot.by_category.get(category, []) if isinstance(category, str) else []
+        previous, following = snapshot.neighbours(term)
+        related_links = term.get("related_links")
+        bundle = {
+            "term": term,
+            "related": summaries(related_links) if related_links is not None else None,
+            "backlinks": summaries(term.get("backlinks")),
+            "category_siblings": [
+                snapshot.summaries[member["_id"]] for member in members if member["_id"] != term["_id"]
+            ][:siblings],
+            "previous": previous,
+            "next": following
+        }
+        cached = response_cache[key] = CachedBody(render_json(bundle), "application/json")
+    return encoded_response(cached, encoding, headers)
+
+
+@app.get("/api/home")
+async def get_home(
+    request: Request,
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Stats, categories and featured terms for the home page in one response"""
+    await counters.ensure_ready()
+    snapshot = await corpus.get()
+    encoding = negotiate_encoding(request)
+    digest = hashlib.sha1(f"{counters.etag}:{snapshot.etag}:{limit}".encode()).hexdigest()
+    etag = f'"{digest[:20]}"'
+    last_modified = max(filter(None, [counters.changed_at, snapshot.last_modified]), default=None)
+    headers = validator_headers(variant_etag(etag, encoding), last_modified)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    cached = home_cache.get(etag)
+    if cached is None:
+        home = {
+            "stats": counters.stats(),
+            "categories": counters.category_counts(),
+            "terms": snapshot.view(snapshot.published[:limit], "summary")
+        }
+        cached = home_cache[etag] = CachedBody(render_json(home), "application/json")
+    return encoded_response(cached, encoding, headers)
 
 
 @app.get("/api/terms/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Get all unique categories with counts"""
-    pipeline = [
-        {"$match": {"status": "published"}},
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    categories = []
-    async for doc in terms_collection.aggregate(pipeline):
-        categories.append({"category": doc["_id"], "count": doc["count"]})
-    return {"categories": categories}
+    await counters.ensure_ready()
+    headers = validator_headers(counters.etag, counters.changed_at)
+    if is_not_modified(request, counters.etag, counters.changed_at):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"categories": counters.category_counts()}, headers=headers)
 
 
 @app.get("/api/terms/category/{category}")
-async def get_terms_by_category(category: str):
+async def get_terms_by_category(
+    category: str,
+    fields: str = Query("full", pattern=FIELDS_PATTERN)
+):
     """Get all terms in a specific category"""
-    query = {"category": category, "status": "published"}
-    cursor = terms_collection.find(query).sort("name", 1)
-    terms = [serialize_doc(doc) async for doc in cursor]
+    snapshot = await corpus.get()
+    terms = snapshot.view(snapshot.by_category.get(category, []), fields)
     return {"category": category, "terms": terms, "count": len(terms)}
 
 
 @app.get("/api/terms/letters")
-async def get_letters_with_counts():
+async def get_letters_with_counts(request: Request):
     """Get all letters with term counts for A-Z navigation"""
-    pipeline = [
-        {"$match": {"status": "published"}},
-        {"$group": {"_id": "$first_letter", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    letters = {}
-    async for doc in terms_collection.aggregate(pipeline):
-        letters[doc["_id"]] = doc["count"]
-    return {"letters": letters}
+    await counters.ensure_ready()
+    headers = validator_headers(counters.etag, counters.changed_at)
+    if is_not_modified(request, counters.etag, counters.changed_at):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"letters": counters.letter_counts()}, headers=headers)
 
 
 @app.get("/api/stats")
-async def get_stats():
+async def get_stats(request: Request):
     """Get overall statistics"""
-    total = await terms_collection.count_documents({})
-    published = await terms_collection.count_documents({"status": "published"})
-    drafts = await terms_collection.count_documents({"status": "draft"})
-    
-    # Categories count
-    pipeline = [{"$group": {"_id": "$category"}}]
-    categories = len([doc async for doc in terms_collection.aggregate(pipeline)])
-    
-    return {
-        "total_terms": total,
-        "published": published,
-        "drafts": drafts,
-        "categories": categories
-    }
+    await counters.ensure_ready()
+    headers = validator_headers(counters.etag, counters.changed_at)
+    if is_not_modified(request, counters.etag, counters.changed_at):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(counters.stats(), headers=headers)
 
 
 @app.get("/api/sitemap.xml")
-async def get_sitemap():
-    """Generate comprehensive SEO sitemap"""
-    base_url = BASE_URL
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"\n'
-    xml += '        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
-    
-    # Home page - highest priority
-    xml += f'''  <url>
-    <loc>{base_url}/</loc>
-    <lastmod>{today}</lastmod>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>\n'''
-    
-    # Resources page
-    xml += f'''  <url>
-    <loc>{base_url}/resources</loc>
-    <lastmod>{today}</lastmod>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>\n'''
-    
-    # Disclaimer page
-    xml += f'''  <url>
-    <loc>{base_url}/disclaimer</loc>
-    <lastmod>{today}</lastmod>
-    <changefreq>monthly</changefreq>
-    <priority>0.5</priority>
-  </url>\n'''
-    
-    # A-Z browse pages
-    for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
-        xml += f'''  <url>
-    <loc>{base_url}/browse/{letter.lower()}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>\n'''
-    
-    # Category pages
-    pipeline = [
-        {"$match": {"status": "published"}},
-        {"$group": {"_id": "$category"}},
-    ]
-    async for doc in terms_collection.aggregate(pipeline):
-        cat_id = doc["_id"]
-        if cat_id and isinstance(cat_id, str):
-            category_slug = cat_id.replace(" ", "%20")
-            xml += f'''  <url>
-    <loc>{base_url}/category/{category_slug}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.7</priority>
-  </url>\n'''
-    
-    # All published terms
-    cursor = terms_collection.find({"status": "published"}, {"slug": 1, "updated_at": 1, "name": 1})
-    async for term in cursor:
-        lastmod = term.get("updated_at", datetime.utcnow())
-        if isinstance(lastmod, str):
-            lastmod = datetime.fromisoformat(lastmod.replace('Z', '+00:00'))
-        lastmod_str = lastmod.strftime("%Y-%m-%d")
-        xml += f'''  <url>
-    <loc>{base_url}/wiki/{term["slug"]}</loc>
-    <lastmod>{lastmod_str}</lastmod>
-    <changefreq>monthly</changefreq>
-    <priority>0.6</priority>
-  </url>\n'''
-    
-    xml += '</urlset>'
-    return Response(content=xml, media_type="application/xml")
+async def get_sitemap(request: Request):
+    """Sitemap index pointing at the URL set shards"""
+    snapshot = await corpus.get()
+    key = ("sitemap-index", snapshot.etag)
+    cached = response_cache.get(key)
+    if cached is None:
+        plan = sitemap_plan(snapshot)
+        cached = response_cache[key] = CachedBody(plan.index_xml().encode("utf-8"), "application/xml")
+    return encoded_response(cached, negotiate_encoding(request), {})
+
+
+@app.get("/api/sitemap-{shard:int}.xml")
+async def get_sitemap_shard(shard: int, request: Request):
+    """One URL set shard, streamed on first build and cached afterwards"""
+    snapshot = await corpus.get()
+    plan = sitemap_plan(snapshot)
+    if shard < 1 or shard > len(plan.shards):
+        raise HTTPException(status_code=404, detail="Sitemap shard not found")
+    key = ("sitemap", snapshot.etag, shard)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return encoded_response(cached, negotiate_encoding(request), {})
+
+    def remember(body: bytes):
+        response_cache[key] = CachedBody(body, "application/xml")
+
+    return StreamingResponse(
+        iter_urlset(plan.shards[shard - 1], remember),
+        media_type="application/xml",
+        headers={"Vary": "Accept-Encoding"}
+    )
 
 
 @app.get("/api/robots.txt")
@@ -421,13 +2067,14 @@ Allow: /
 
 # Admin Routes
 @app.post("/api/admin/login")
-async def admin_login(data: AdminLogin):
+async def admin_login(data: AdminLogin, request: Request):
     """Admin login endpoint"""
+    throttle_login(request, data.username)
     admin = await admins_collection.find_one({"username": data.username})
     if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not bcrypt.checkpw(data.password.encode(), admin["password_hash"].encode()):
+    if not await check_password(data.password, admin["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(admin["username"])
@@ -446,19 +2093,41 @@ async def admin_list_terms(
     limit: int = Query(50, ge=1, le=100),
     status: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     admin = Depends(get_current_admin)
 ):
-    """Admin: List all terms with pagination"""
-    skip = (page - 1) * limit
+    """Admin: List all terms with pagination (page numbers or keyset cursor)"""
     query = {}
     if status:
         query["status"] = status
     if search:
         query["name"] = {"$regex": search, "$options": "i"}
     
-    cursor = terms_collection.find(query).sort("name", 1).skip(skip).limit(limit)
-    terms = [serialize_doc(doc) async for doc in cursor]
-    total = await terms_collection.count_documents(query)
+    if cursor is not None:
+        page_query = dict(query)
+        if cursor:
+            name, term_id = decode_cursor(cursor)
+            after = {"$or": [
+                {"name": {"$gt": name}},
+                {"name": name, "_id": {"$gt": ObjectId(term_id)}}
+            ]}
+            page_query = {"$and": [query, after]} if query else after
+        docs = terms_collection.find(page_query).sort([("name", 1), ("_id", 1)]).limit(limit + 1)
+        terms = [serialize_doc(doc) async for doc in docs]
+        next_cursor = None
+        if len(terms) > limit:
+            terms = terms[:limit]
+            next_cursor = encode_cursor(terms[-1]["name"], terms[-1]["_id"])
+        result = {"terms": terms, "limit": limit, "next_cursor": next_cursor}
+        if include_total:
+            result["total"] = await count_terms(query)
+        return result
+    
+    skip = (page - 1) * limit
+    docs = terms_collection.find(query).sort([("name", 1), ("_id", 1)]).skip(skip).limit(limit)
+    terms = [serialize_doc(doc) async for doc in docs]
+    total = await count_terms(query)
     
     return {
         "terms": terms,
@@ -488,15 +2157,21 @@ async def create_term(data: TermCreate, admin = Depends(get_current_admin)):
         "related_terms": data.related_terms or [],
         "authority_links": data.authority_links or [],
         "first_letter": get_first_letter(data.name),
+        "link_keys": link_keys(data.name),
         "status": data.status or "draft",
         "meta_title": f"{data.name} - BariWiki",
         "meta_description": data.short_description or f"Learn about {data.name} in bariatric surgery.",
+        "generation_fingerprint": MANUAL_FINGERPRINT if data.description else None,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
     
     result = await terms_collection.insert_one(term)
-    term["_id"] = str(result.inserted_id)
+    record_term_change(None, term)
+    await update_forward_links(term)
+    await relink_referrers(term["link_keys"])
+    
+    term = await terms_collection.find_one({"_id": result.inserted_id})
     return serialize_doc(term)
 
 
@@ -526,6 +2201,7 @@ async def update_term(term_id: str, data: TermUpdate, admin = Depends(get_curren
     if "name" in update_data:
         update_data["slug"] = slugify(update_data["name"])
         update_data["first_letter"] = get_first_letter(update_data["name"])
+        update_data["link_keys"] = link_keys(update_data["name"])
         update_data["meta_title"] = f"{update_data['name']} - BariWiki"
     
     if "short_description" in update_data:
@@ -533,9 +2209,20 @@ async def update_term(term_id: str, data: TermUpdate, admin = Depends(get_curren
     
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await terms_collection.update_one({"_id": oid}, {"$set": update_data})
-    if result.matched_count == 0:
+    before = await terms_collection.find_one_and_update({"_id": oid}, {"$set": update_data})
+    if before is None:
         raise HTTPException(status_code=404, detail="Term not found")
+    if "description" in update_data and update_data["description"] != before.get("description"):
+        # Hand-written text must not be overwritten by prompt-upgrade regeneration
+        await terms_collection.update_one({"_id": oid}, {"$set": {"generation_fingerprint": MANUAL_FINGERPRINT}})
+    
+    term = await terms_collection.find_one({"_id": oid})
+    record_term_change(before, term)
+    if "name" in update_data or "related_terms" in update_data:
+        await update_forward_links(term)
+    if "name" in update_data:
+        sources = [ObjectId(link["term_id"]) for link in term.get("backlinks") or []]
+        await relink_referrers(term["link_keys"], sources)
     
     term = await terms_collection.find_one({"_id": oid})
     return serialize_doc(term)
@@ -549,9 +2236,11 @@ async def delete_term(term_id: str, admin = Depends(get_current_admin)):
     except:
         raise HTTPException(status_code=400, detail="Invalid term ID")
     
-    result = await terms_collection.delete_one({"_id": oid})
-    if result.deleted_count == 0:
+    deleted = await terms_collection.find_one_and_delete({"_id": oid})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Term not found")
+    record_term_change(deleted, None)
+    await unlink_deleted_term(deleted)
     
     return {"message": "Term deleted successfully"}
 
@@ -565,71 +2254,23 @@ async def import_terms(
     if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
         raise HTTPException(status_code=400, detail="Only Excel or CSV files are supported")
     
+    # The upload is gone once this request returns, so spool it to disk for the job
+    suffix = os.path.splitext(file.filename)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as upload:
+        await run_in_threadpool(shutil.copyfileobj, file.file, upload)
+    job = await submit_job("import", {"path": upload.name, "filename": file.filename}, admin)
+    return queued_response(job, "Import queued")
+
+
+@job_handler("import")
+async def run_import_job(job: dict, report) -> dict:
+    payload = job["payload"]
     try:
-        content = await file.read()
-        
-        # Read file based on extension
-        if file.filename.endswith('.csv'):
-            import io
-            df = pd.read_csv(io.BytesIO(content))
-        else:
-            import io
-            df = pd.read_excel(io.BytesIO(content))
-        
-        # Get the first column as terms
-        if len(df.columns) == 0:
-            raise HTTPException(status_code=400, detail="Empty file")
-        
-        terms_column = df.iloc[:, 0].dropna().tolist()
-        
-        # Also add the column header if it's a valid term
-        first_col_name = df.columns[0]
-        if isinstance(first_col_name, str) and first_col_name.strip():
-            terms_column.insert(0, first_col_name.strip())
-        
-        imported = 0
-        skipped = 0
-        
-        for term_name in terms_column:
-            if not isinstance(term_name, str) or not term_name.strip():
-                continue
-            
-            term_name = term_name.strip()
-            slug = slugify(term_name)
-            
-            # Skip if already exists
-            existing = await terms_collection.find_one({"slug": slug})
-            if existing:
-                skipped += 1
-                continue
-            
-            term = {
-                "name": term_name,
-                "slug": slug,
-                "description": "",
-                "short_description": "",
-                "category": "Uncategorized",
-                "related_terms": [],
-                "authority_links": [],
-                "first_letter": get_first_letter(term_name),
-                "status": "draft",
-                "meta_title": f"{term_name} - BariWiki",
-                "meta_description": f"Learn about {term_name} in bariatric surgery.",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
-            await terms_collection.insert_one(term)
-            imported += 1
-        
-        return {
-            "message": f"Import complete: {imported} terms imported, {skipped} skipped (duplicates)",
-            "imported": imported,
-            "skipped": skipped
-        }
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+        with open(payload["path"], "rb") as fileobj:
+            return await import_upload(payload["filename"], fileobj, report)
+    finally:
+        if os.path.exists(payload["path"]):
+            os.remove(payload["path"])
 
 
 @app.post("/api/admin/terms/{term_id}/generate")
@@ -647,12 +2288,22 @@ async def generate_description(
     if not term:
         raise HTTPException(status_code=404, detail="Term not found")
     
-    if not EMERGENT_LLM_KEY:
-        raise HTTPException(status_code=500, detail="AI key not configured")
+    if not llm_provider.configured:
+        raise HTTPException(status_code=500, detail=llm_provider.setup_error)
+    
+    job = await submit_job("generate", {"term_id": term_id}, admin)
+    return queued_response(job, "Generation queued")
+
+
+@job_handler("generate")
+async def run_generate_job(job: dict, report) -> dict:
+    oid = ObjectId(job["payload"]["term_id"])
+    term = await terms_collection.find_one({"_id": oid})
+    if not term:
+        raise HTTPException(status_code=404, detail="Term not found")
+    await report(0, 1, f"Generating description for {term['name']}")
     
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
         # Get some related terms from database for context
         related_cursor = terms_collection.find(
             {"_id": {"$ne": oid}},
@@ -676,33 +2327,22 @@ Respond ONLY with valid JSON in this exact structure:
 
 Include at least 2 authority links from reputable medical sources."""
         
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"bariwiki-gen-{term_id}",
-            system_message=system_prompt
-        ).with_model("gemini", "gemini-2.5-flash")
+        generator = GenerationClient(
+            llm_provider,
+            system_prompt=system_prompt,
+            limiter=generation_limiter,
+            cache=llm_cache
+        )
         
-        user_message = UserMessage(
-            text=f"""Generate an encyclopedia entry for: "{term['name']}"
+        parsed = await generator.complete_json(
+            f"""Generate an encyclopedia entry for: "{term['name']}"
 
 Available related terms: {json.dumps(available_terms[:15])}
 
-Respond ONLY with valid JSON."""
+Respond ONLY with valid JSON.""",
+            session_id=f"bariwiki-gen-{oid}"
         )
         
-        response = await chat.send_message(user_message)
-        
-        # Parse response
-        response_text = response.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        parsed = json.loads(response_text.strip())
-        
         # Update term with generated content
         update_data = {
             "description": parsed.get("description", ""),
@@ -711,12 +2351,18 @@ Respond ONLY with valid JSON."""
             "related_terms": parsed.get("related_terms", []),
             "authority_links": parsed.get("authority_links", []),
             "meta_description": parsed.get("short_description", ""),
+            **generator.stamp(),
             "updated_at": datetime.utcnow()
         }
         
         await terms_collection.update_one({"_id": oid}, {"$set": update_data})
         
+        before, term = term, await terms_collection.find_one({"_id": oid})
+        record_term_change(before, term)
+        await update_forward_links(term)
+        
         term = await terms_collection.find_one({"_id": oid})
+        await report(1, 1, "Description generated")
         return {"message": "Description generated successfully", "term": serialize_doc(term)}
     
     except Exception as e:
@@ -731,13 +2377,12 @@ async def publish_term(term_id: str, admin = Depends(get_current_admin)):
     except:
         raise HTTPException(status_code=400, detail="Invalid term ID")
     
-    result = await terms_collection.update_one(
-        {"_id": oid},
-        {"$set": {"status": "published", "updated_at": datetime.utcnow()}}
-    )
+    update_data = {"status": "published", "updated_at": datetime.utcnow()}
+    before = await terms_collection.find_one_and_update({"_id": oid}, {"$set": update_data})
     
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Term not found")
+    record_term_change(before, {**before, **update_data})
     
     return {"message": "Term published successfully"}
 
@@ -745,13 +2390,57 @@ async def publish_term(term_id: str, admin = Depends(get_current_admin)):
 @app.post("/api/admin/batch-publish")
 async def batch_publish(admin = Depends(get_current_admin)):
     """Admin: Publish all draft terms"""
+    drafts = await terms_collection.find(
+        {"status": "draft"}, {"status": 1, "first_letter": 1, "category": 1}
+    ).to_list(length=None)
+    update_data = {"status": "published", "updated_at": datetime.utcnow()}
     result = await terms_collection.update_many(
-        {"status": "draft"},
-        {"$set": {"status": "published", "updated_at": datetime.utcnow()}}
+        {"_id": {"$in": [doc["_id"] for doc in drafts]}, "status": "draft"},
+        {"$set": update_data}
     )
+    for doc in drafts:
+        record_term_change(doc, {**doc, **update_data})
+    if result.modified_count != len(drafts):
+        # Some drafts changed underneath us; recount instead of guessing
+        await counters.reconcile()
     return {"message": f"{result.modified_count} terms published"}
 
 
+@app.get("/api/admin/jobs/{job_id}")
+async def get_job(job_id: str, admin = Depends(get_current_admin)):
+    """Admin: Poll a background job; also hands out a fresh events_token"""
+    job = await jobs_collection.find_one({"_id": parse_job_id(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**serialize_job(job), "events_token": create_job_events_token(job["_id"])}
+
+
+@app.get("/api/admin/jobs/{job_id}/events")
+async def stream_job(job_id: str, token: str = Query(...)):
+    """Admin: Server-Sent Events stream of a background job's progress.
+
+    Authenticated by the job's events_token (from the 202 response or
+    GET /api/admin/jobs/{job_id}), never by an admin token.
+    """
+    oid = parse_job_id(job_id)
+    if not verify_job_events_token(token, oid):
+        raise HTTPException(status_code=401, detail="Invalid or expired job token")
+    if not await jobs_collection.find_one({"_id": oid}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_event_stream(oid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/admin/links/rebuild")
+async def rebuild_links(admin = Depends(get_current_admin)):
+    """Admin: Recompute the related-terms graph for every term"""
+    count = await rebuild_link_graph()
+    return {"message": f"Related-terms graph rebuilt for {count} terms"}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
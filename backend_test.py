@@ -81,6 +81,15 @@ class BariWikiAPITester:
             200
         )
 
+    def test_home(self):
+        """Test aggregated home page endpoint"""
+        return self.run_test(
+            "Get Home",
+            "GET",
+            "/api/home",
+            200
+        )
+
     def test_admin_login(self, username="admin", password="BariWiki2024!"):
         """Test admin login"""
         success, response = self.run_test(
@@ -228,6 +237,24 @@ class BariWikiAPITester:
             200
         )
 
+    def test_suggest_terms(self):
+        """Test autocomplete suggestions"""
+        return self.run_test(
+            "Suggest Terms",
+            "GET",
+            "/api/terms/suggest?q=gast",
+            200
+        )
+
+    def test_get_term_bundle(self):
+        """Test the single-request term page bundle"""
+        return self.run_test(
+            "Get Term Bundle",
+            "GET",
+            "/api/terms/slug/gastric-bypass/bundle",
+            200
+        )
+
     def test_get_terms_by_letter(self):
         """Test getting terms by letter"""
         return self.run_test(
@@ -274,6 +301,7 @@ def main():
     
     tester.test_health_check()
     tester.test_stats()
+    tester.test_home()
     
     # Admin authentication
     print("\n" + "=" * 70)
@@ -307,6 +335,8 @@ def main():
     tester.test_get_letters()
     tester.test_get_categories()
     tester.test_search_terms()
+    tester.test_suggest_terms()
+    tester.test_get_term_bundle()
     tester.test_get_terms_by_letter()
     tester.test_get_terms_by_category()
     
@@ -2,10 +2,19 @@
 """
 Batch AI Description Generator for BariWiki
 Generates descriptions for all terms using Gemini AI
+
+USAGE:
+    python3 batch_generate_descriptions.py [--concurrency N] [--rpm N] [--tpm N] [--lease-seconds N]
+                                           [--terms-per-request N] [--max-output-tokens N]
+
+Terms are leased before generation, so several copies can run side by side
+without generating the same term twice.
 """
 
+import argparse
 import asyncio
 import json
+import logging
 import os
 import sys
 from datetime import datetime
@@ -13,17 +22,15 @@ from dotenv import load_dotenv
 
 load_dotenv('/app/backend/.env')
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from generation import (
+    BudgetExceeded, GenerationClient, RateLimited, RateLimiter, ResponseCache, TermLeases, provider_from_env, run_workers,
+    terms_per_request
+)
+
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 
-# Try to import the LLM library
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-    LLM_AVAILABLE = True
-except ImportError:
-    LLM_AVAILABLE = False
-    print("Warning: emergentintegrations not available")
-
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "bariwiki")
 EMERGENT_LLM_KEY = os.environ.get("EMERGENT_LLM_KEY")
@@ -72,58 +79,66 @@ Guidelines:
 RESPOND ONLY WITH VALID JSON. No additional text."""
 
 
-async def generate_description(term_name: str, available_terms: list) -> dict:
-    """Generate AI description for a single term"""
-    if not LLM_AVAILABLE or not EMERGENT_LLM_KEY:
-        return None
-    
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"bariwiki-batch-{term_name[:20].replace(' ', '-')}",
-            system_message=SYSTEM_PROMPT
-        ).with_model("gemini", "gemini-2.5-flash")
-        
-        user_message = UserMessage(
-            text=f"""Generate an encyclopedia entry for the bariatric surgery term: "{term_name}"
+async def generate_description(generator: GenerationClient, term_name: str, available_terms: list) -> tuple:
+    """Generate AI description for a single term; returns (result, error)"""
+    prompt = f"""Generate an encyclopedia entry for the bariatric surgery term: "{term_name}"
 
 Available related terms to choose from: {json.dumps(available_terms[:20])}
 
 Respond ONLY with valid JSON."""
-        )
-        
-        response = await chat.send_message(user_message)
-        
-        # Parse response
-        response_text = response.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        return json.loads(response_text.strip())
+    try:
+        return await generator.complete_json(prompt, session_id=f"bariwiki-batch-{term_name[:20].replace(' ', '-')}"), None
     
+    except (BudgetExceeded, RateLimited):
+        raise
     except Exception as e:
         print(f"  Error generating for '{term_name}': {str(e)[:100]}")
-        return None
+        return None, str(e) or type(e).__name__
+
+
+async def generate_descriptions(generator: GenerationClient, term_names: list, available_terms: list) -> tuple:
+    """Generate AI descriptions for several terms in one request; returns
+    (results, errors), both keyed by term name"""
+    context = f"Available related terms to choose from: {json.dumps(available_terms[:20])}"
+    try:
+        results, failures = await generator.complete_json_batch(
+            term_names, context, session_id=f"bariwiki-batch-{term_names[0][:20].replace(' ', '-')}"
+        )
+    except (BudgetExceeded, RateLimited):
+        raise
+    except Exception as e:
+        print(f"  Error generating for {len(term_names)} terms: {str(e)[:100]}")
+        return {}, {name: str(e) or type(e).__name__ for name in term_names}
+    for name, reason in failures.items():
+        print(f"  Error generating for '{name}': {reason}")
+    return results, failures
 
 
-async def batch_generate():
+async def batch_generate(concurrency: int = 8, rpm: float = 60, tpm: float = 200000, lease_seconds: int = 300,
+                         per_request: int = 1, max_attempts: int = 5):
     """Main batch generation function"""
     print("=" * 60)
     print("BariWiki Batch AI Description Generator")
     print("=" * 60)
     
-    if not EMERGENT_LLM_KEY:
-        print("ERROR: EMERGENT_LLM_KEY not configured")
+    provider = provider_from_env(EMERGENT_LLM_KEY)
+    if not provider.configured:
+        print(f"ERROR: {provider.setup_error}")
         return
     
+    generator = GenerationClient(
+        provider,
+        system_prompt=SYSTEM_PROMPT,
+        limiter=RateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm or None),
+        cache=ResponseCache.from_env()
+    )
+    
     # Connect to MongoDB
     client = AsyncIOMotorClient(MONGO_URL)
     db = client[DB_NAME]
     terms_collection = db["terms"]
+    leases = TermLeases(terms_collection, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    print(f"Worker ID: {leases.worker_id}")
     
     # Get all terms that need descriptions (empty description)
     query = {"$or": [{"description": ""}, {"description": {"$exists": False}}]}
@@ -135,27 +150,46 @@ async def batch_generate():
     all_terms_cursor = terms_collection.find({}, {"name": 1})
     all_term_names = [doc["name"] async for doc in all_terms_cursor]
     
-    # Process in batches
-    batch_size = 10
     processed = 0
     successful = 0
     failed = 0
     
-    cursor = terms_collection.find(query)
+    # Failed terms back off before they are claimable again, so they are
+    # retried by later runs rather than this one
+    async def next_group():
+        group = []
+        while len(group) < per_request:
+            term = await leases.claim(query)
+            if term is None:
+                break
+            group.append(term)
+        return group or None
+    
+    async def process(group):
+        try:
+            if len(group) == 1:
+                term_name = group[0]["name"]
+                # Get related terms (exclude current term)
+                related_candidates = [t for t in all_term_names if t != term_name]
+                result, error = await generate_description(generator, term_name, related_candidates)
+                results, errors = {term_name: result}, {term_name: error}
+            else:
+                results, errors = await generate_descriptions(generator, [term["name"] for term in group], all_term_names)
+        except RateLimited as e:
+            # Still throttled after every retry: requeue without spending an attempt
+            for term in group:
+                await leases.defer(term, f"Rate limited: {e}")
+                print(f"  ↻ {term['name']} - Rate limited, requeued")
+            return
+        for term in group:
+            await save(term, results.get(term["name"]), errors.get(term["name"]))
     
-    async for term in cursor:
+    async def save(term, result, error=None):
+        nonlocal processed, successful, failed
         term_id = term["_id"]
         term_name = term["name"]
         
         processed += 1
-        print(f"\n[{processed}/{total_to_process}] Generating: {term_name}")
-        
-        # Get related terms (exclude current term)
-        related_candidates = [t for t in all_term_names if t != term_name]
-        
-        # Generate description
-        result = await generate_description(term_name, related_candidates)
-        
         if result:
             # Update term in database
             update_data = {
@@ -165,27 +199,34 @@ async def batch_generate():
                 "related_terms": result.get("related_terms", []),
                 "authority_links": result.get("authority_links", []),
                 "meta_description": result.get("short_description", ""),
+                **generator.stamp(),
                 "updated_at": datetime.utcnow()
             }
             
-            await terms_collection.update_one(
-                {"_id": term_id},
-                {"$set": update_data}
-            )
+            if not await leases.complete(term_id, update_data):
+                print(f"[{processed}/{total_to_process}] ⚠ {term_name} - Lease expired before the result was saved")
+                return
             
             successful += 1
-            print(f"  ✓ Success - Category: {result.get('category', 'N/A')}")
+            print(f"[{processed}/{total_to_process}] ✓ {term_name} - Category: {result.get('category', 'N/A')}")
         else:
+            failure = await leases.fail(term, error or "Empty response")
             failed += 1
-            print(f"  ✗ Failed")
-        
-        # Small delay to avoid rate limiting
-        await asyncio.sleep(0.5)
+            if failure and failure["dead_letter"]:
+                print(f"[{processed}/{total_to_process}] ✗ {term_name} - Failed {failure['attempts']} times, dead-lettered")
+            else:
+                print(f"[{processed}/{total_to_process}] ✗ {term_name} - Failed")
         
         # Progress report every 50 terms
         if processed % 50 == 0:
             print(f"\n--- Progress: {processed}/{total_to_process} ({successful} successful, {failed} failed) ---\n")
     
+    try:
+        async with leases.held():
+            await run_workers(next_group, process, concurrency)
+    except BudgetExceeded:
+        print("\n⛔ Stopping: budget limit reached on the Emergent Universal Key.")
+    
     print("\n" + "=" * 60)
     print("BATCH GENERATION COMPLETE")
     print(f"  Total processed: {processed}")
@@ -193,6 +234,13 @@ async def batch_generate():
     print(f"  Failed: {failed}")
     print("=" * 60)
     
+    dead = await leases.dead_letters()
+    if dead:
+        print(f"\nDead-lettered terms ({len(dead)}):")
+        for term in dead:
+            failure = term["generation_failure"]
+            print(f"  {term['name']} ({failure['attempts']} attempts): {failure['last_error'][:100]}")
+    
     # Show category distribution
     print("\nCategory Distribution:")
     pipeline = [
@@ -206,4 +254,18 @@ async def batch_generate():
 
 
 if __name__ == "__main__":
-    asyncio.run(batch_generate())
+    parser = argparse.ArgumentParser(description="Generate AI descriptions for every BariWiki term missing one")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once (default: 8)")
+    parser.add_argument("--rpm", type=float, default=60, help="Max requests per minute (default: 60)")
+    parser.add_argument("--tpm", type=float, default=200000, help="Max tokens per minute, 0 for no limit (default: 200000)")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="Lease length for claimed terms (default: 300)")
+    parser.add_argument("--terms-per-request", type=int, default=1, help="Terms packed into each LLM request (default: 1)")
+    parser.add_argument("--max-output-tokens", type=int, default=8192, help="Model output token limit (default: 8192)")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Failures before a term is dead-lettered (default: 5)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="  %(message)s")
+    asyncio.run(batch_generate(
+        args.concurrency, args.rpm, args.tpm, args.lease_seconds,
+        per_request=terms_per_request(args.terms_per_request, args.max_output_tokens),
+        max_attempts=args.max_attempts
+    ))
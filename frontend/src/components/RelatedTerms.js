@@ -2,39 +2,55 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import { ArrowRight } from 'lucide-react';
 
-const RelatedTerms = ({ terms = [] }) => {
-  if (terms.length === 0) return null;
+// Convert term names to slugs for linking
+const slugify = (text) => {
+  return text
+    .toLowerCase()
+    .trim()
+    .replace(/[^\w\s-]/g, '')
+    .replace(/[-\s]+/g, '-');
+};
+
+const TermLinkList = ({ title, items, testId }) => (
+  <div 
+    className="rounded-md border bg-white p-4"
+    data-testid={testId}
+  >
+    <h3 className="font-medium text-neutral-800 mb-3">{title}</h3>
+    <ul className="space-y-2">
+      {items.map((item, index) => (
+        <li key={item.slug}>
+          <Link 
+            to={`/wiki/${item.slug}`}
+            className="flex items-center gap-2 text-sm text-blue-600 hover:text-blue-800 group"
+            data-testid={`${testId.replace(/s$/, '')}-${index}`}
+          >
+            <ArrowRight className="h-3 w-3 opacity-0 group-hover:opacity-100 transition-opacity" />
+            <span>{item.name}</span>
+          </Link>
+        </li>
+      ))}
+    </ul>
+  </div>
+);
+
+const RelatedTerms = ({ terms = [], links = null, backlinks = [] }) => {
+  // Prefer links the server resolved to existing terms; fall back to
+  // guessing slugs from the stored names for terms not yet resolved
+  const related = (links || (terms || []).map((name) => ({ name, slug: slugify(name) }))).slice(0, 6);
+  const linkedFrom = (backlinks || []).slice(0, 10);
 
-  // Convert term names to slugs for linking
-  const slugify = (text) => {
-    return text
-      .toLowerCase()
-      .trim()
-      .replace(/[^\w\s-]/g, '')
-      .replace(/[-\s]+/g, '-');
-  };
+  if (related.length === 0 && linkedFrom.length === 0) return null;
 
   return (
-    <div 
-      className="rounded-md border bg-white p-4"
-      data-testid="related-terms"
-    >
-      <h3 className="font-medium text-neutral-800 mb-3">Related Terms</h3>
-      <ul className="space-y-2">
-        {terms.slice(0, 6).map((term, index) => (
-          <li key={index}>
-            <Link 
-              to={`/wiki/${slugify(term)}`}
-              className="flex items-center gap-2 text-sm text-blue-600 hover:text-blue-800 group"
-              data-testid={`related-term-${index}`}
-            >
-              <ArrowRight className="h-3 w-3 opacity-0 group-hover:opacity-100 transition-opacity" />
-              <span>{term}</span>
-            </Link>
-          </li>
-        ))}
-      </ul>
-    </div>
+    <>
+      {related.length > 0 && (
+        <TermLinkList title="Related Terms" items={related} testId="related-terms" />
+      )}
+      {linkedFrom.length > 0 && (
+        <TermLinkList title="What Links Here" items={linkedFrom} testId="backlinks" />
+      )}
+    </>
   );
 };
 
@@ -0,0 +1,58 @@
+const API_URL = process.env.REACT_APP_BACKEND_URL || '';
+
+const TERMINAL_STATES = ['completed', 'failed'];
+
+// Follow a background job until it finishes. `queued` is the 202 body
+// ({job_id, events_token}). Progress arrives over Server-Sent Events,
+// authorised by the job's own short-lived events_token, since EventSource
+// can only pass it in the URL; if the stream drops we fall back to polling
+// with the admin token. Resolves with the job's result, rejects with its
+// error.
+export function waitForJob(queued, token, onProgress) {
+  const jobId = queued.job_id;
+  return new Promise((resolve, reject) => {
+    const settle = (job) => {
+      if (onProgress) onProgress(job);
+      if (job.status === 'completed') {
+        resolve(job.result);
+        return true;
+      }
+      if (job.status === 'failed') {
+        reject(new Error(job.error || 'Job failed'));
+        return true;
+      }
+      return false;
+    };
+
+    const poll = async () => {
+      try {
+        const response = await fetch(`${API_URL}/api/admin/jobs/${jobId}`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        const job = await response.json();
+        if (!response.ok) throw new Error(job.detail || 'Failed to load job');
+        if (!settle(job)) setTimeout(poll, 1000);
+      } catch (error) {
+        reject(error);
+      }
+    };
+
+    if (typeof EventSource === 'undefined' || !queued.events_token) {
+      poll();
+      return;
+    }
+
+    const source = new EventSource(
+      `${API_URL}/api/admin/jobs/${jobId}/events?token=${encodeURIComponent(queued.events_token)}`
+    );
+    source.onmessage = (event) => {
+      const job = JSON.parse(event.data);
+      if (TERMINAL_STATES.includes(job.status)) source.close();
+      settle(job);
+    };
+    source.onerror = () => {
+      source.close();
+      poll();
+    };
+  });
+}
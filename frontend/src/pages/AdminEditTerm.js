@@ -9,6 +9,7 @@ import { Input } from '../components/ui/input';
 import { Button } from '../components/ui/button';
 import { Textarea } from '../components/ui/textarea';
 import { toast } from 'sonner';
+import { waitForJob } from '../lib/jobs';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
 
@@ -121,7 +122,8 @@ const AdminEditTerm = () => {
       });
 
       if (response.ok) {
-        const data = await response.json();
+        const queued = await response.json();
+        const data = await waitForJob(queued, token);
         const term = data.term;
         setFormData(prev => ({
           ...prev,
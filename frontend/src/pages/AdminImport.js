@@ -7,6 +7,7 @@ import {
 } from 'lucide-react';
 import { Button } from '../components/ui/button';
 import { toast } from 'sonner';
+import { waitForJob } from '../lib/jobs';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
 
@@ -14,6 +15,7 @@ const AdminImport = () => {
   const [file, setFile] = useState(null);
   const [uploading, setUploading] = useState(false);
   const [result, setResult] = useState(null);
+  const [progress, setProgress] = useState('');
   const navigate = useNavigate();
 
   const handleFileChange = (e) => {
@@ -50,31 +52,34 @@ const AdminImport = () => {
         body: formData
       });
 
-      const data = await response.json();
-
-      if (response.ok) {
-        setResult({
-          success: true,
-          imported: data.imported,
-          skipped: data.skipped,
-          message: data.message
-        });
-        toast.success(data.message);
-      } else {
-        setResult({
-          success: false,
-          message: data.detail || 'Import failed'
-        });
-        toast.error(data.detail || 'Import failed');
+      const queued = await response.json();
+      if (!response.ok) {
+        throw new Error(queued.detail || 'Import failed');
       }
+
+      setProgress('Queued');
+      const data = await waitForJob(queued, token, (job) => {
+        setProgress(job.progress?.message || job.status);
+      });
+
+      setResult({
+        success: true,
+        imported: data.imported,
+        skipped: data.skipped,
+        invalid: data.invalid,
+        rows: (data.rows || []).filter((row) => row.status !== 'imported'),
+        message: data.message
+      });
+      toast.success(data.message);
     } catch (error) {
       setResult({
         success: false,
         message: error.message
       });
-      toast.error('Import failed');
+      toast.error(error.message || 'Import failed');
     } finally {
       setUploading(false);
+      setProgress('');
     }
   };
 
@@ -196,7 +201,7 @@ const AdminImport = () => {
                   data-testid="admin-bulk-import-button"
                 >
                   <Upload className="h-4 w-4 mr-2" />
-                  {uploading ? 'Importing...' : 'Import Terms'}
+                  {uploading ? (progress ? `Importing... ${progress}` : 'Importing...') : 'Import Terms'}
                 </Button>
               </div>
 
@@ -224,6 +229,15 @@ const AdminImport = () => {
                       }`}>
                         {result.message}
                       </p>
+                      {result.success && result.rows?.length > 0 && (
+                        <ul className="mt-3 max-h-48 overflow-y-auto text-sm text-neutral-600 space-y-1">
+                          {result.rows.slice(0, 100).map((row) => (
+                            <li key={row.row}>
+                              Row {row.row}: {row.name} · {row.status}{row.reason ? ` (${row.reason})` : ''}
+                            </li>
+                          ))}
+                        </ul>
+                      )}
                       {result.success && (
                         <div className="mt-4">
                           <Link to="/admin/terms">
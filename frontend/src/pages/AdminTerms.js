@@ -9,6 +9,7 @@ import { Input } from '../components/ui/input';
 import { Button } from '../components/ui/button';
 import { toast } from 'sonner';
 import CategoryBadge from '../components/CategoryBadge';
+import { waitForJob } from '../lib/jobs';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
 
@@ -99,6 +100,8 @@ const AdminTerms = () => {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       if (response.ok) {
+        const queued = await response.json();
+        await waitForJob(queued, token);
         toast.success('Description generated!');
         fetchTerms();
       } else {
@@ -26,7 +26,7 @@ const BrowsePage = () => {
     const fetchTerms = async () => {
       setLoading(true);
       try {
-        const response = await fetch(`${API_URL}/api/terms/letter/${upperLetter}`);
+        const response = await fetch(`${API_URL}/api/terms/letter/${upperLetter}?fields=summary`);
         const data = await response.json();
         setTerms(data.terms || []);
       } catch (error) {
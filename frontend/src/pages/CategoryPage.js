@@ -25,7 +25,7 @@ const CategoryPage = () => {
     const fetchTerms = async () => {
       setLoading(true);
       try {
-        const response = await fetch(`${API_URL}/api/terms/category/${encodeURIComponent(decodedCategory)}`);
+        const response = await fetch(`${API_URL}/api/terms/category/${encodeURIComponent(decodedCategory)}?fields=summary`);
         const data = await response.json();
         setTerms(data.terms || []);
       } catch (error) {
@@ -26,19 +26,12 @@ const HomePage = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const [statsRes, categoriesRes, termsRes] = await Promise.all([
-          fetch(`${API_URL}/api/stats`),
-          fetch(`${API_URL}/api/terms/categories`),
-          fetch(`${API_URL}/api/terms?limit=10&status=published`)
-        ]);
+        const response = await fetch(`${API_URL}/api/home?limit=10`);
+        const data = await response.json();
 
-        const statsData = await statsRes.json();
-        const categoriesData = await categoriesRes.json();
-        const termsData = await termsRes.json();
-
-        setStats(statsData);
-        setCategories(categoriesData.categories || []);
-        setRecentTerms(termsData.terms || []);
+        setStats(data.stats || { total_terms: 0, published: 0, categories: 0 });
+        setCategories(data.categories || []);
+        setRecentTerms(data.terms || []);
       } catch (error) {
         console.error('Failed to fetch data:', error);
       } finally {
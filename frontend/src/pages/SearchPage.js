@@ -16,6 +16,8 @@ const SearchPage = () => {
   const [results, setResults] = useState([]);
   const [loading, setLoading] = useState(false);
   const [searched, setSearched] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const [didYouMean, setDidYouMean] = useState(null);
 
   useEffect(() => {
     if (initialQuery) {
@@ -23,15 +25,43 @@ const SearchPage = () => {
     }
   }, [initialQuery]);
 
+  useEffect(() => {
+    const trimmed = query.trim();
+    if (!trimmed || trimmed === initialQuery) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `${API_URL}/api/terms/suggest?q=${encodeURIComponent(trimmed)}&limit=8`,
+          { signal: controller.signal }
+        );
+        const data = await response.json();
+        setSuggestions(data.suggestions || []);
+      } catch (error) {
+        if (error.name !== 'AbortError') {
+          console.error('Suggest failed:', error);
+        }
+      }
+    }, 120);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query, initialQuery]);
+
   const performSearch = async (searchQuery) => {
     if (!searchQuery.trim()) return;
     
     setLoading(true);
     setSearched(true);
     try {
-      const response = await fetch(`${API_URL}/api/terms/search?q=${encodeURIComponent(searchQuery)}&limit=50`);
+      const response = await fetch(`${API_URL}/api/terms/search?q=${encodeURIComponent(searchQuery)}&limit=50&fuzzy=true`);
       const data = await response.json();
       setResults(data.terms || []);
+      setDidYouMean(data.did_you_mean || null);
     } catch (error) {
       console.error('Search failed:', error);
     } finally {
@@ -42,6 +72,7 @@ const SearchPage = () => {
   const handleSearch = (e) => {
     e.preventDefault();
     if (query.trim()) {
+      setSuggestions([]);
       setSearchParams({ q: query.trim() });
       performSearch(query.trim());
     }
@@ -75,6 +106,24 @@ const SearchPage = () => {
               className="w-full h-12 pl-10 text-base"
               data-testid="search-input"
             />
+            {suggestions.length > 0 && (
+              <ul
+                className="absolute z-10 mt-1 w-full bg-white border rounded-md shadow-sm"
+                data-testid="search-suggestions"
+              >
+                {suggestions.map((suggestion) => (
+                  <li key={suggestion.slug}>
+                    <Link
+                      to={`/wiki/${suggestion.slug}`}
+                      className="block px-4 py-2 hover:bg-neutral-50"
+                      data-testid={`search-suggestion-${suggestion.slug}`}
+                    >
+                      {suggestion.name}
+                    </Link>
+                  </li>
+                ))}
+              </ul>
+            )}
           </div>
           <Button type="submit" size="lg" className="h-12" data-testid="search-submit">
             Search
@@ -83,6 +132,15 @@ const SearchPage = () => {
 
         {/* Results */}
         <section className="pb-12" data-testid="search-results">
+          {!loading && didYouMean && (
+            <p className="mb-4 text-neutral-600" data-testid="search-did-you-mean">
+              Did you mean{' '}
+              <Link to={`/search?q=${encodeURIComponent(didYouMean)}`} className="text-blue-600 hover:underline">
+                {didYouMean}
+              </Link>
+              ?
+            </p>
+          )}
           {loading ? (
             <div className="space-y-4">
               {Array(5).fill(0).map((_, i) => (
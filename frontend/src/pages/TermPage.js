@@ -22,6 +22,7 @@ const TermPage = () => {
   const SITE_URL = getSiteUrl();
   const { slug } = useParams();
   const [term, setTerm] = useState(null);
+  const [bundle, setBundle] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [headings, setHeadings] = useState([]);
@@ -31,7 +32,7 @@ const TermPage = () => {
       setLoading(true);
       setError(null);
       try {
-        const response = await fetch(`${API_URL}/api/terms/slug/${slug}`);
+        const response = await fetch(`${API_URL}/api/terms/slug/${slug}/bundle`);
         if (!response.ok) {
           if (response.status === 404) {
             setError('Term not found');
@@ -41,7 +42,8 @@ const TermPage = () => {
           return;
         }
         const data = await response.json();
-        setTerm(data);
+        setTerm(data.term);
+        setBundle(data);
 
         // Extract headings from description for ToC
         setTimeout(() => {
@@ -303,6 +305,22 @@ const TermPage = () => {
                 </ol>
               </section>
             )}
+
+            {/* Alphabetical neighbours */}
+            {(bundle?.previous || bundle?.next) && (
+              <nav className="mt-8 flex justify-between gap-4 text-sm" data-testid="term-neighbours">
+                {bundle?.previous ? (
+                  <Link to={`/wiki/${bundle.previous.slug}`} className="text-blue-600 hover:underline">
+                    ← {bundle.previous.name}
+                  </Link>
+                ) : <span />}
+                {bundle?.next && (
+                  <Link to={`/wiki/${bundle.next.slug}`} className="text-blue-600 hover:underline">
+                    {bundle.next.name} →
+                  </Link>
+                )}
+              </nav>
+            )}
           </div>
 
           {/* Sidebar */}
@@ -310,7 +328,11 @@ const TermPage = () => {
             <div data-testid="toc-container">
               <TocSidebar headings={headings} />
             </div>
-            <RelatedTerms terms={term?.related_terms} />
+            <RelatedTerms
+              terms={term?.related_terms}
+              links={bundle?.related}
+              backlinks={bundle?.backlinks}
+            />
             <AuthorityLinks links={term?.authority_links} />
           </aside>
         </article>
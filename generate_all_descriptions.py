@@ -11,7 +11,26 @@ USAGE:
 
 OPTIONS:
     --batch-size N    Number of terms to process per run (default: 100)
-    --delay N         Seconds to wait between API calls (default: 0.5)
+    --concurrency N   Requests in flight at once (default: 8)
+    --rpm N           Max requests per minute (default: 60)
+    --tpm N           Max tokens per minute, 0 for no limit (default: 200000)
+    --lease-seconds N How long a claimed term stays reserved without a
+                      heartbeat (default: 300)
+    --terms-per-request N
+                      Pack N terms into each LLM request (default: 1)
+    --max-output-tokens N
+                      Model output limit used to cap --terms-per-request
+                      (default: 8192)
+    --regenerate      Rewrite descriptions produced by an older prompt or
+                      model instead of filling in missing ones
+    --budget N        Stop after N terms this session, 0 for no limit
+                      (default: 0)
+    --max-attempts N  Failed attempts before a term is dead-lettered (default: 5)
+    --retry-after N   Seconds before a failed term is retried, doubled after
+                      each further failure (default: 60)
+    --dead-letters    List dead-lettered terms and their last error, then exit
+    --requeue-dead-letters
+                      Give dead-lettered terms a fresh set of attempts
     --continuous      Keep running until all terms are processed
     --dry-run         Show what would be processed without making changes
 
@@ -19,40 +38,69 @@ EXAMPLES:
     # Process 100 terms (default)
     python3 generate_all_descriptions.py
     
-    # Process 50 terms with 1 second delay
-    python3 generate_all_descriptions.py --batch-size 50 --delay 1
+    # Process 50 terms, staying under 30 requests per minute
+    python3 generate_all_descriptions.py --batch-size 50 --rpm 30
+    
+    # Send 5 terms per request to cut round trips and prompt overhead
+    python3 generate_all_descriptions.py --terms-per-request 5
     
     # Run continuously until all terms are done
     python3 generate_all_descriptions.py --continuous
     
     # Check status without processing
     python3 generate_all_descriptions.py --dry-run
+    
+    # See which terms keep failing, then retry them after fixing the cause
+    python3 generate_all_descriptions.py --dead-letters
+    python3 generate_all_descriptions.py --requeue-dead-letters
+    
+    # After editing SYSTEM_PROMPT, roll it out to the 200 most important terms
+    python3 generate_all_descriptions.py --regenerate --budget 200 --continuous
 
 NOTES:
-    - The script only processes terms that don't have descriptions yet
+    - The script only processes terms that don't have descriptions yet,
+      unless --regenerate is given
+    - Every saved description records a fingerprint of the prompt and model
+      that produced it. --regenerate selects terms whose fingerprint differs
+      from the current one, published terms first, then by page views.
+      Descriptions edited by hand in the admin are never regenerated
     - You can stop the script at any time (Ctrl+C) and resume later
+    - Several copies can run at once (on one machine or many): each term is
+      leased to one worker before it is generated, and leases held by a
+      crashed worker expire after --lease-seconds
     - Progress is saved to the database automatically
-    - If you hit API rate limits, increase the --delay value
+    - Terms are generated concurrently; throughput is bounded by --rpm/--tpm
+      rather than by the latency of each call
+    - A term that fails (bad JSON, timeout) is not retried until its backoff
+      expires, and after --max-attempts failures it is dead-lettered, so a
+      run always moves on to other terms
+    - Rate-limit (429) responses pause all workers with an exponential
+      backoff; if they keep happening, lower --rpm. A term whose request
+      is still throttled after every retry is requeued for --retry-after
+      seconds without counting as a failed attempt
+    - LLM_PROVIDER=mock (in-process) or LLM_PROVIDER=http with
+      mock_llm_server.py swaps in an offline stand-in for benchmarking
+      throughput and retry behaviour; use it against a scratch database
 """
 
 import asyncio
 import argparse
 import json
+import logging
+import os
 import sys
+import time
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from generation import (
+    BudgetExceeded, EmergentProvider, GenerationClient, RateLimited, RateLimiter, ResponseCache, TermLeases,
+    provider_from_env, run_workers, terms_per_request
+)
+
 # MongoDB connection
 from motor.motor_asyncio import AsyncIOMotorClient
 
-# Emergent LLM integration
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-    LLM_AVAILABLE = True
-except ImportError:
-    print("ERROR: emergentintegrations package not installed.")
-    print("Install with: pip install emergentintegrations --extra-index-url https://d33sy5i8bnduwe.cloudfront.net/simple/")
-    LLM_AVAILABLE = False
-
 # =============================================================================
 # CONFIGURATION - Edit these values if needed
 # =============================================================================
@@ -101,50 +149,68 @@ Include 2-3 authority links from:
 RESPOND ONLY WITH VALID JSON. No markdown, no explanations."""
 
 
-async def generate_description(term_name: str, related_terms: list) -> dict:
-    """Generate AI description for a single term using Gemini."""
-    if not LLM_AVAILABLE:
-        return None
-    
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"bariwiki-gen-{hash(term_name) % 100000}",
-            system_message=SYSTEM_PROMPT
-        ).with_model("gemini", "gemini-2.5-flash")
-        
-        user_message = UserMessage(
-            text=f"""Generate a comprehensive medical encyclopedia entry for the bariatric surgery term: "{term_name}"
+async def generate_description(generator: GenerationClient, term_name: str, related_terms: list) -> tuple:
+    """Generate AI description for a single term using Gemini.
+
+    Returns (result, None) on success or (None, reason) on failure.
+    """
+    prompt = f"""Generate a comprehensive medical encyclopedia entry for the bariatric surgery term: "{term_name}"
 
 Available related terms to choose from: {json.dumps(related_terms[:15])}
 
 Respond with valid JSON only."""
-        )
-        
-        response = await chat.send_message(user_message)
-        
-        # Clean up response - remove markdown code blocks if present
-        response_text = response.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        elif response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        
-        return json.loads(response_text.strip())
+    try:
+        return await generator.complete_json(prompt, session_id=f"bariwiki-gen-{hash(term_name) % 100000}"), None
     
+    except BudgetExceeded:
+        print(f"    ⚠️  Budget limit reached. Please add balance to your Emergent Universal Key.")
+        print(f"       Go to: Profile -> Universal Key -> Add Balance")
+        raise
+    except RateLimited:
+        raise
     except json.JSONDecodeError as e:
         print(f"    JSON parse error: {str(e)[:50]}")
-        return None
+        return None, f"JSON parse error: {e}"
     except Exception as e:
-        error_msg = str(e)
-        if "Budget" in error_msg:
-            print(f"    ⚠️  Budget limit reached. Please add balance to your Emergent Universal Key.")
-            print(f"       Go to: Profile -> Universal Key -> Add Balance")
-            return "BUDGET_ERROR"
-        print(f"    Error: {error_msg[:80]}")
-        return None
+        print(f"    Error: {str(e)[:80]}")
+        return None, str(e) or type(e).__name__
+
+
+async def generate_descriptions(generator: GenerationClient, term_names: list, related_terms: list) -> tuple:
+    """Generate AI descriptions for several terms in one request.
+
+    Returns ({term name: result}, {term name: reason}); terms whose entry was
+    missing or malformed (even after a retry of just those terms) are in the
+    second dict.
+    """
+    context = f"Available related terms to choose from: {json.dumps(related_terms[:15])}"
+    try:
+        results, failures = await generator.complete_json_batch(
+            term_names, context, session_id=f"bariwiki-gen-{hash(tuple(term_names)) % 100000}"
+        )
+    except BudgetExceeded:
+        print(f"    ⚠️  Budget limit reached. Please add balance to your Emergent Universal Key.")
+        print(f"       Go to: Profile -> Universal Key -> Add Balance")
+        raise
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"    Error: {str(e)[:80]}")
+        return {}, {name: str(e) or type(e).__name__ for name in term_names}
+    for name, reason in failures.items():
+        print(f"    {name[:50]}: {reason}")
+    return results, failures
+
+
+def print_dead_letters(terms: list):
+    """Report of terms that exhausted their attempts."""
+    print(f"\n☠️  Dead-lettered terms: {len(terms)}")
+    for term in terms:
+        failure = term["generation_failure"]
+        print(f"   {term['name'][:50]} ({failure['attempts']} attempts, last {failure['last_failed_at']:%Y-%m-%d %H:%M} UTC)")
+        print(f"      {failure['last_error'][:120]}")
+    if terms:
+        print("\n   Requeue with --requeue-dead-letters once the cause is fixed.")
 
 
 async def get_stats(terms_collection):
@@ -152,6 +218,7 @@ async def get_stats(terms_collection):
     total = await terms_collection.count_documents({})
     with_desc = await terms_collection.count_documents({"description": {"$ne": ""}})
     without_desc = total - with_desc
+    dead_lettered = await terms_collection.count_documents({"generation_failure.dead_letter": True})
     
     # Category distribution
     pipeline = [
@@ -171,6 +238,7 @@ async def get_stats(terms_collection):
         "total": total,
         "with_descriptions": with_desc,
         "without_descriptions": without_desc,
+        "dead_lettered": dead_lettered,
         "completion_percent": round(100 * with_desc / total, 1) if total > 0 else 0,
         "categories": categories
     }
@@ -179,12 +247,25 @@ async def get_stats(terms_collection):
 async def main():
     parser = argparse.ArgumentParser(description="Generate AI descriptions for BariWiki terms")
     parser.add_argument("--batch-size", type=int, default=100, help="Terms per batch (default: 100)")
-    parser.add_argument("--delay", type=float, default=0.5, help="Delay between API calls in seconds (default: 0.5)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once (default: 8)")
+    parser.add_argument("--rpm", type=float, default=60, help="Max requests per minute (default: 60)")
+    parser.add_argument("--tpm", type=float, default=200000, help="Max tokens per minute, 0 for no limit (default: 200000)")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="Lease length for claimed terms (default: 300)")
+    parser.add_argument("--terms-per-request", type=int, default=1, help="Terms packed into each LLM request (default: 1)")
+    parser.add_argument("--max-output-tokens", type=int, default=8192, help="Model output token limit (default: 8192)")
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate descriptions from an older prompt or model")
+    parser.add_argument("--budget", type=int, default=0, help="Max terms this session, 0 for no limit (default: 0)")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Failures before a term is dead-lettered (default: 5)")
+    parser.add_argument("--retry-after", type=float, default=60, help="Seconds before retrying a failed term, doubled per attempt (default: 60)")
+    parser.add_argument("--dead-letters", action="store_true", help="List dead-lettered terms and exit")
+    parser.add_argument("--requeue-dead-letters", action="store_true", help="Give dead-lettered terms fresh attempts before running")
     parser.add_argument("--continuous", action="store_true", help="Run until all terms are processed")
     parser.add_argument("--dry-run", action="store_true", help="Show status without processing")
     args = parser.parse_args()
     
-    if not LLM_AVAILABLE:
+    provider = provider_from_env(EMERGENT_LLM_KEY)
+    if not provider.configured:
+        print(f"ERROR: {provider.setup_error}")
         sys.exit(1)
     
     # Connect to MongoDB
@@ -197,27 +278,61 @@ async def main():
     db = client[DB_NAME]
     terms_collection = db["terms"]
     
+    leases = TermLeases(
+        terms_collection, lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts, retry_base=args.retry_after
+    )
+    if args.dead_letters:
+        print_dead_letters(await leases.dead_letters())
+        client.close()
+        return
+    if args.requeue_dead_letters:
+        print(f"Requeued {await leases.requeue_dead_letters()} dead-lettered terms")
+    
     # Get initial stats
     stats = await get_stats(terms_collection)
     print(f"\n📊 Current Status:")
     print(f"   Total terms: {stats['total']}")
     print(f"   With descriptions: {stats['with_descriptions']}")
     print(f"   Need descriptions: {stats['without_descriptions']}")
+    print(f"   Dead-lettered: {stats['dead_lettered']}")
     print(f"   Completion: {stats['completion_percent']}%")
     print(f"\n📁 Category Distribution:")
     for cat, count in stats["categories"].items():
         print(f"   {cat}: {count}")
     
+    generator = GenerationClient(
+        provider,
+        system_prompt=SYSTEM_PROMPT,
+        limiter=RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm or None),
+        cache=ResponseCache.from_env()
+    )
+    if args.regenerate:
+        # Stale terms, most important first: published before draft, then by views
+        query = generator.stale_query()
+        sort = [("status", -1), ("views", -1), ("_id", 1)]
+        print(f"   Stale descriptions (prompt/model {generator.fingerprint}): {await terms_collection.count_documents(query)}")
+    else:
+        query = {"$or": [{"description": ""}, {"description": {"$exists": False}}]}
+        sort = None
+    
     if args.dry_run:
         print("\n[Dry run - no changes made]")
         client.close()
         return
     
-    if stats["without_descriptions"] == 0:
+    if not args.regenerate and stats["without_descriptions"] == 0:
         print("\n✅ All terms already have descriptions!")
         client.close()
         return
     
+    print(f"Worker ID: {leases.worker_id}")
+    if not isinstance(provider, EmergentProvider):
+        print(f"Provider: {provider.name}/{provider.model}")
+    per_request = terms_per_request(args.terms_per_request, args.max_output_tokens)
+    if per_request != args.terms_per_request:
+        print(f"Using {per_request} terms per request to stay within {args.max_output_tokens} output tokens")
+    
     # Get all term names for related terms suggestions
     all_terms_cursor = terms_collection.find({}, {"name": 1})
     all_term_names = [doc["name"] async for doc in all_terms_cursor]
@@ -226,80 +341,137 @@ async def main():
     total_processed = 0
     total_successful = 0
     total_failed = 0
+    total_dead_lettered = 0
+    total_requeued = 0
     
-    while True:
-        # Query for terms without descriptions
-        query = {"$or": [{"description": ""}, {"description": {"$exists": False}}]}
-        remaining = await terms_collection.count_documents(query)
-        
-        if remaining == 0:
-            print("\n✅ All terms now have descriptions!")
-            break
-        
-        batch_to_process = min(args.batch_size, remaining)
-        print(f"\n{'=' * 60}")
-        print(f"Processing batch of {batch_to_process} terms ({remaining} remaining)")
-        print("=" * 60)
-        
-        cursor = terms_collection.find(query).limit(batch_to_process)
-        batch_successful = 0
-        batch_failed = 0
-        
-        async for term in cursor:
-            term_id = term["_id"]
-            term_name = term["name"]
+    budget_exhausted = False
+    started = time.monotonic()
+    async with leases.held():
+        while True:
+            remaining = await terms_collection.count_documents(query)
             
-            total_processed += 1
-            print(f"\n[{total_processed}] {term_name[:50]}...")
+            if remaining == 0:
+                if args.regenerate:
+                    print("\n✅ All descriptions are up to date!")
+                else:
+                    print("\n✅ All terms now have descriptions!")
+                break
+            if args.budget and total_processed >= args.budget:
+                print(f"\nBudget of {args.budget} terms reached ({remaining} still to do).")
+                break
             
-            # Get related terms (exclude current term)
-            related_candidates = [t for t in all_term_names if t.lower() != term_name.lower()]
+            batch_to_process = min(args.batch_size, remaining)
+            if args.budget:
+                batch_to_process = min(batch_to_process, args.budget - total_processed)
+            print(f"\n{'=' * 60}")
+            print(f"Processing batch of {batch_to_process} terms ({remaining} remaining)")
+            print("=" * 60)
             
-            # Generate description
-            result = await generate_description(term_name, related_candidates)
+            claimed = 0
+            batch_successful = 0
+            batch_failed = 0
             
-            if result == "BUDGET_ERROR":
-                print("\n⛔ Stopping due to budget limit.")
-                print("   Add balance at: Profile -> Universal Key -> Add Balance")
-                client.close()
-                sys.exit(1)
+            async def next_group():
+                # Claim terms as workers free up, so this process never
+                # reserves more than it is actively generating
+                nonlocal claimed
+                group = []
+                while len(group) < per_request and claimed < batch_to_process:
+                    claimed += 1
+                    term = await leases.claim(query, sort=sort)
+                    if term is None:
+                        break
+                    group.append(term)
+                return group or None
             
-            if result:
-                # Update term in database
-                update_data = {
-                    "description": result.get("description", ""),
-                    "short_description": result.get("short_description", ""),
-                    "category": result.get("category", "Uncategorized"),
-                    "related_terms": result.get("related_terms", []),
-                    "authority_links": result.get("authority_links", []),
-                    "meta_description": result.get("short_description", ""),
-                    "updated_at": datetime.utcnow()
-                }
-                
-                await terms_collection.update_one({"_id": term_id}, {"$set": update_data})
+            async def process(group):
+                nonlocal total_requeued
+                try:
+                    if len(group) == 1:
+                        term_name = group[0]["name"]
+                        # Get related terms (exclude current term)
+                        related_candidates = [t for t in all_term_names if t.lower() != term_name.lower()]
+                        result, error = await generate_description(generator, term_name, related_candidates)
+                        results, failures = {term_name: result}, {term_name: error}
+                    else:
+                        results, failures = await generate_descriptions(generator, [term["name"] for term in group], all_term_names)
+                except RateLimited as e:
+                    # Throttling is the provider's problem, not the term's:
+                    # put the terms back without spending an attempt
+                    for term in group:
+                        await leases.defer(term, f"Rate limited: {e}")
+                        total_requeued += 1
+                        print(f"    ↻ {term['name'][:50]} - Rate limited, requeued")
+                    return
+                for term in group:
+                    await save(term, results.get(term["name"]), failures.get(term["name"]))
+            
+            async def save(term, result, error=None):
+                nonlocal total_processed, total_successful, total_failed, total_dead_lettered, batch_successful, batch_failed
+                term_id = term["_id"]
+                term_name = term["name"]
                 
-                batch_successful += 1
-                total_successful += 1
-                print(f"    ✓ Category: {result.get('category', 'N/A')}")
-            else:
-                batch_failed += 1
-                total_failed += 1
-                print(f"    ✗ Failed")
+                total_processed += 1
+                if result:
+                    # Update term in database
+                    update_data = {
+                        "description": result.get("description", ""),
+                        "short_description": result.get("short_description", ""),
+                        "category": result.get("category", "Uncategorized"),
+                        "related_terms": result.get("related_terms", []),
+                        "authority_links": result.get("authority_links", []),
+                        "meta_description": result.get("short_description", ""),
+                        **generator.stamp(),
+                        "updated_at": datetime.utcnow()
+                    }
+                    
+                    if not await leases.complete(term_id, update_data):
+                        print(f"[{total_processed}] ⚠ {term_name[:50]} - Lease expired before the result was saved")
+                        return
+                    
+                    batch_successful += 1
+                    total_successful += 1
+                    print(f"[{total_processed}] ✓ {term_name[:50]} - Category: {result.get('category', 'N/A')}")
+                else:
+                    failure = await leases.fail(term, error or "Empty response")
+                    batch_failed += 1
+                    total_failed += 1
+                    if failure and failure["dead_letter"]:
+                        total_dead_lettered += 1
+                        print(f"[{total_processed}] ✗ {term_name[:50]} - Failed {failure['attempts']} times, dead-lettered")
+                    elif failure:
+                        print(f"[{total_processed}] ✗ {term_name[:50]} - Failed (attempt {failure['attempts']}, retry after {failure['next_attempt_at']:%H:%M:%S} UTC)")
+                    else:
+                        print(f"[{total_processed}] ✗ {term_name[:50]} - Failed")
             
-            # Delay between API calls
-            await asyncio.sleep(args.delay)
-        
-        # Batch summary
-        print(f"\n--- Batch Complete ---")
-        print(f"    Successful: {batch_successful}")
-        print(f"    Failed: {batch_failed}")
-        
-        # Overall progress
-        stats = await get_stats(terms_collection)
-        print(f"\n📊 Overall Progress: {stats['completion_percent']}% ({stats['with_descriptions']}/{stats['total']})")
+            try:
+                await run_workers(next_group, process, args.concurrency)
+            except BudgetExceeded:
+                budget_exhausted = True
+                break
+            
+            if batch_successful + batch_failed == 0:
+                print("\nRemaining terms are leased by other workers, waiting to retry or dead-lettered.")
+                break
+            
+            # Batch summary
+            print(f"\n--- Batch Complete ---")
+            print(f"    Successful: {batch_successful}")
+            print(f"    Failed: {batch_failed}")
+            
+            # Overall progress
+            stats = await get_stats(terms_collection)
+            print(f"\n📊 Overall Progress: {stats['completion_percent']}% ({stats['with_descriptions']}/{stats['total']})")
+            
+            if not args.continuous:
+                break
         
-        if not args.continuous:
-            break
+
+    if budget_exhausted:
+        print("\n⛔ Stopping due to budget limit.")
+        print("   Add balance at: Profile -> Universal Key -> Add Balance")
+        client.close()
+        sys.exit(1)
     
     # Final summary
     print("\n" + "=" * 60)
@@ -308,11 +480,20 @@ async def main():
     print(f"Total processed this session: {total_processed}")
     print(f"Successful: {total_successful}")
     print(f"Failed: {total_failed}")
+    print(f"Dead-lettered: {total_dead_lettered}")
+    print(f"Requeued after rate limiting: {total_requeued}")
+    elapsed = time.monotonic() - started
+    print(f"Elapsed: {elapsed:.1f}s ({60 * total_successful / elapsed if elapsed else 0:.1f} terms/min)")
+    print(f"LLM requests: {generator.stats['requests']} "
+          f"(rate limited: {generator.stats['rate_limited']}, errors: {generator.stats['errors']}, "
+          f"cache hits: {generator.stats['cache_hits']})")
     
     final_stats = await get_stats(terms_collection)
     print(f"\n📊 Final Status:")
     print(f"   Completion: {final_stats['completion_percent']}%")
     print(f"   Remaining: {final_stats['without_descriptions']} terms")
+    if final_stats["dead_lettered"]:
+        print(f"   Dead-lettered: {final_stats['dead_lettered']} terms (see --dead-letters)")
     
     print(f"\n📁 Category Distribution:")
     for cat, count in final_stats["categories"].items():
@@ -322,6 +503,8 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Rate-limit backoffs from the generation client, in line with the progress output
+    logging.basicConfig(level=logging.INFO, format="    %(message)s")
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
-"""Quick batch generator - processes terms in small batches"""
+"""Quick batch generator - processes terms in small batches
+
+Usage: generate_batch.py [BATCH] [CONCURRENCY] [RPM] [TERMS_PER_REQUEST]
+"""
 import asyncio
-import json
+import logging
 import os
 import sys
 from datetime import datetime
@@ -9,7 +12,12 @@ from dotenv import load_dotenv
 load_dotenv('/app/backend/.env')
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from generation import (
+    BudgetExceeded, GenerationClient, RateLimited, RateLimiter, ResponseCache, TermLeases, provider_from_env, run_workers,
+    terms_per_request
+)
 
 MONGO_URL = os.environ.get("MONGO_URL")
 DB_NAME = os.environ.get("DB_NAME", "bariwiki")
@@ -18,18 +26,32 @@ KEY = os.environ.get("EMERGENT_LLM_KEY")
 PROMPT = """Medical encyclopedia writer for bariatric surgery. Return ONLY valid JSON:
 {"description":"HTML description with <p> tags","short_description":"max 160 chars","category":"Procedures|Complications|Anatomy|Nutrition|Medications|Conditions|Diagnostic Tests|Patient Care|Equipment|Outcomes","related_terms":["term1","term2"],"authority_links":[{"title":"t","url":"u","source":"NIH|Mayo Clinic|ASMBS"}]}"""
 
-async def gen(name):
+async def gen(llm, name):
+    try:
+        return await llm.complete_json(f'Term: "{name}" - JSON only', session_id=f"bw{hash(name)%10000}"), None
+    except (BudgetExceeded, RateLimited):
+        raise
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+async def gen_many(llm, names):
     try:
-        chat = LlmChat(api_key=KEY, session_id=f"bw{hash(name)%10000}", system_message=PROMPT).with_model("gemini", "gemini-2.5-flash")
-        r = await chat.send_message(UserMessage(text=f'Term: "{name}" - JSON only'))
-        t = r.strip()
-        if "```" in t: t = t.split("```")[1].replace("json","").strip()
-        return json.loads(t)
+        return await llm.complete_json_batch(names, "JSON array only", session_id=f"bw{hash(tuple(names))%10000}")
+    except (BudgetExceeded, RateLimited):
+        raise
     except Exception as e:
-        return None
+        return {}, {n: str(e) or type(e).__name__ for n in names}
 
 async def main():
     BATCH = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    RPM = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+    PER_REQUEST = terms_per_request(int(sys.argv[4]) if len(sys.argv) > 4 else 1)
+    provider = provider_from_env(KEY)
+    if not provider.configured:
+        print(f"ERROR: {provider.setup_error}")
+        return
+    llm = GenerationClient(provider, system_prompt=PROMPT, limiter=RateLimiter(requests_per_minute=RPM), cache=ResponseCache.from_env())
     client = AsyncIOMotorClient(MONGO_URL)
     terms = client[DB_NAME]["terms"]
     
@@ -37,30 +59,71 @@ async def main():
     total = await terms.count_documents(q)
     print(f"Processing {min(BATCH, total)} of {total} terms...")
     
-    cursor = terms.find(q).limit(BATCH)
-    ok = fail = 0
+    leases = TermLeases(terms)
+    ok = fail = claimed = 0
     
-    async for t in cursor:
-        r = await gen(t["name"])
+    async def claim():
+        nonlocal claimed
+        group = []
+        while len(group) < PER_REQUEST and claimed < BATCH:
+            claimed += 1
+            t = await leases.claim(q)
+            if t is None: break
+            group.append(t)
+        return group or None
+    
+    async def many(group):
+        try:
+            if len(group) == 1:
+                r, e = await gen(llm, group[0]["name"])
+                results, errors = {group[0]["name"]: r}, {group[0]["name"]: e}
+            else:
+                results, errors = await gen_many(llm, [t["name"] for t in group])
+        except RateLimited as e:
+            # Throttled, not broken: requeue without spending an attempt
+            for t in group:
+                await leases.defer(t, f"Rate limited: {e}")
+                print(f"↻ {t['name'][:40]} (rate limited, requeued)")
+            return
+        for t in group:
+            await one(t, results.get(t["name"]), errors.get(t["name"]))
+    
+    async def one(t, r, e=None):
+        nonlocal ok, fail
         if r:
-            await terms.update_one({"_id": t["_id"]}, {"$set": {
+            if not await leases.complete(t["_id"], {
                 "description": r.get("description", ""),
                 "short_description": r.get("short_description", ""),
                 "category": r.get("category", "Uncategorized"),
                 "related_terms": r.get("related_terms", []),
                 "authority_links": r.get("authority_links", []),
+                **llm.stamp(),
                 "updated_at": datetime.utcnow()
-            }})
+            }):
+                print(f"⚠ {t['name'][:40]} (lease expired before the result was saved)")
+                return
             ok += 1
             print(f"✓ [{ok+fail}] {t['name'][:40]} -> {r.get('category','?')}")
         else:
+            f = await leases.fail(t, e or "Empty response")
             fail += 1
-            print(f"✗ [{ok+fail}] {t['name'][:40]}")
-        await asyncio.sleep(0.2)
+            print(f"✗ [{ok+fail}] {t['name'][:40]}" + (" (dead-lettered)" if f and f["dead_letter"] else ""))
+    
+    try:
+        async with leases.held():
+            await run_workers(claim, many, CONCURRENCY)
+    except BudgetExceeded:
+        print("Stopped: budget limit reached")
     
     print(f"\nDone: {ok} success, {fail} failed")
     remaining = await terms.count_documents(q)
     print(f"Remaining: {remaining}")
+    dead = await leases.dead_letters()
+    if dead:
+        print(f"Dead-lettered: {len(dead)}")
+        for t in dead:
+            print(f"  {t['name'][:40]}: {t['generation_failure']['last_error'][:80]}")
     client.close()
 
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 asyncio.run(main())
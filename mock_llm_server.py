@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+BariWiki - Mock LLM Server
+==========================
+
+Serves an OpenAI-compatible /v1/chat/completions endpoint that answers with
+schema-valid encyclopedia JSON, so the generation pipeline (rate limiting,
+backoff, retries, batching, dead-lettering) can be run and benchmarked
+offline without spending money on the Emergent key.
+
+USAGE:
+    python3 mock_llm_server.py [OPTIONS]
+
+OPTIONS:
+    --host HOST             Interface to listen on (default: 127.0.0.1)
+    --port N                Port to listen on (default: 8011)
+    --latency SECONDS       Mean response time (default: 0.5)
+    --jitter FRACTION       Latency varies by +/- this fraction (default: 0.25)
+    --error-rate P          Share of requests answered with HTTP 500 (default: 0)
+    --rate-limit-rate P     Share of requests answered with HTTP 429 (default: 0)
+    --malformed-rate P      Share of replies truncated to invalid JSON (default: 0)
+    --seed N                Seed for the draws above (default: 0)
+
+EXAMPLES:
+    # Terminal 1: a slow, flaky provider
+    python3 mock_llm_server.py --latency 2 --rate-limit-rate 0.1 --malformed-rate 0.05
+
+    # Terminal 2: point a generator at it (use a scratch database!)
+    LLM_PROVIDER=http LLM_BASE_URL=http://127.0.0.1:8011 LLM_CACHE_MAX_MB=0 \\
+        python3 generate_all_descriptions.py --concurrency 16 --rpm 600
+
+NOTES:
+    - The same behaviour is available in-process with LLM_PROVIDER=mock and
+      the MOCK_LLM_LATENCY / MOCK_LLM_JITTER / MOCK_LLM_ERROR_RATE /
+      MOCK_LLM_RATE_LIMIT_RATE / MOCK_LLM_MALFORMED_RATE / MOCK_LLM_SEED
+      environment variables; the server adds real HTTP round trips.
+    - Outcomes are seeded per prompt and per repeat of that prompt, so two
+      runs with the same seed fail the same terms on the same attempts.
+    - Generated descriptions are placeholders. Never point a generator that
+      uses this server at the production database.
+    - Set LLM_CACHE_MAX_MB=0 when benchmarking, or repeat runs are answered
+      from the response cache instead of the server.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from generation import MockProvider, estimate_tokens
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    provider: MockProvider = None
+    counts = Counter()
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, dict(self.counts))
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "Not found"}})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            messages = request["messages"]
+            prompt = next(m["content"] for m in reversed(messages) if m.get("role") == "user")
+        except (ValueError, KeyError, StopIteration, TypeError):
+            self.send_json(400, {"error": {"message": "Expected a chat completions request"}})
+            return
+
+        outcome, delay = self.provider.draw(prompt)
+        time.sleep(delay)
+        self.counts[outcome] += 1
+        if outcome == "rate_limited":
+            self.send_json(429, {"error": {"message": "Rate limit exceeded (mock)"}}, {"Retry-After": "1"})
+            return
+        if outcome == "error":
+            self.send_json(500, {"error": {"message": "Internal error (mock)"}})
+            return
+
+        content = self.provider.reply(prompt, malformed=outcome == "malformed")
+        prompt_tokens = sum(estimate_tokens(m.get("content")) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        self.send_json(200, {
+            "id": f"mock-{self.counts.total()}",
+            "object": "chat.completion",
+            "model": request.get("model") or self.provider.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock LLM server for offline generation runs")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8011, help="Port to listen on (default: 8011)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean response time in seconds (default: 0.5)")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Latency spread as a fraction (default: 0.25)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 replies (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of HTTP 429 replies (default: 0)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of truncated JSON replies (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and failure draws (default: 0)")
+    args = parser.parse_args()
+
+    MockHandler.provider = MockProvider(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, malformed_rate=args.malformed_rate, seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Mock LLM server on http://{args.host}:{args.port}/v1/chat/completions (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nServed: {dict(MockHandler.counts)}")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
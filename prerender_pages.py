@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+BariWiki - Static Prerender Pipeline
+====================================
+
+Writes fully rendered HTML (meta tags, Open Graph, JSON-LD) for every
+published term, A-Z letter page and category page into a directory that a
+CDN can serve directly, so crawlers and first visits never need the React
+bundle or an API round trip.
+
+USAGE:
+    python3 prerender_pages.py [OPTIONS]
+
+OPTIONS:
+    --source mongo|export   Read terms from MongoDB (default) or a JSON export
+    --export-file PATH      Export file for --source export (default: bariwiki_export.json)
+    --output DIR            Output directory (default: prerendered)
+    --base-url URL          Canonical site URL (default: $BASE_URL or https://parnellwellness.com)
+    --force                 Rewrite every page, even ones the manifest says are current
+
+EXAMPLES:
+    # Incremental build from the database
+    python3 prerender_pages.py
+
+    # Build from the checked-in export without a database
+    python3 prerender_pages.py --source export --output /var/www/bariwiki
+
+NOTES:
+    - Builds are incremental: a manifest in the output directory records a
+      fingerprint per page (term updated_at, resolved links, template
+      version) and only changed pages are rewritten.
+    - Pages for terms that were deleted or unpublished are removed.
+    - Output layout mirrors the SPA routes: wiki/<slug>/index.html,
+      browse/<letter>/index.html, category/<slug>/index.html.
+    - Related terms link through the resolved link graph (related_links);
+      terms the API has not resolved yet list their related names unlinked.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+load_dotenv('/app/backend/.env')
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "bariwiki")
+DEFAULT_BASE_URL = os.environ.get("BASE_URL", "https://parnellwellness.com")
+SITE_NAME = "BariWiki by Parnell Wellness"
+MANIFEST_NAME = ".prerender-manifest.json"
+
+# Bump when the page templates change so every page is rewritten once
+TEMPLATE_VERSION = "1"
+
+
+def slugify(text: str) -> str:
+    """Same slug rules as the API"""
+    text = text.lower().strip()
+    text = re.sub(r'[^\w\s-]', '', text)
+    text = re.sub(r'[-\s]+', '-', text)
+    return text
+
+
+def related_items(term: dict, slugs: set) -> list:
+    """(name, slug or None) for the related terms shown on a term page.
+
+    Links come from the resolved related_links, and only to pages that are
+    being rendered; a term whose links are not resolved yet lists its raw
+    related names without links rather than guessing slugs.
+    """
+    links = term.get("related_links")
+    if links is None:
+        return [(name, None) for name in (term.get("related_terms") or []) if isinstance(name, str)][:6]
+    return [(link["name"], link["slug"]) for link in links if link.get("slug") in slugs][:6]
+
+
+def esc(value) -> str:
+    return html.escape(str(value or ""), quote=True)
+
+
+def json_ld(data: dict) -> str:
+    """JSON-LD script body that cannot close its own <script> tag"""
+    return json.dumps(data, ensure_ascii=False).replace("</", "<\\/")
+
+
+def fingerprint(*parts) -> str:
+    raw = json.dumps([TEMPLATE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def date_string(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value or "")
+
+
+def page_shell(title: str, description: str, canonical: str, head_extra: str, body: str) -> str:
+    return f"""<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1" />
+<title>{esc(title)}</title>
+<meta name="title" content="{esc(title)}" />
+<meta name="description" content="{esc(description)}" />
+<link rel="canonical" href="{esc(canonical)}" />
+<meta name="robots" content="index, follow" />
+<meta property="og:url" content="{esc(canonical)}" />
+<meta property="og:title" content="{esc(title)}" />
+<meta property="og:description" content="{esc(description)}" />
+<meta property="og:site_name" content="{esc(SITE_NAME)}" />
+<meta name="twitter:title" content="{esc(title)}" />
+<meta name="twitter:description" content="{esc(description)}" />
+{head_extra}
+</head>
+<body>
+<main id="main">
+{body}
+</main>
+</body>
+</html>
+"""
+
+
+def render_term(term: dict, slugs: set, base_url: str) -> str:
+    name = term["name"]
+    url = f"{base_url}/wiki/{term['slug']}"
+    category = term.get("category") or "Uncategorized"
+    category_url = f"{base_url}/category/{quote(str(category))}"
+    description = (
+        term.get("meta_description") or term.get("short_description")
+        or f"Learn about {name} in bariatric surgery. Comprehensive medical information and expert resources."
+    )
+    updated_at = date_string(term.get("updated_at"))
+    links = term.get("authority_links") or []
+
+    structured = [
+        {
+            "@context": "https://schema.org",
+            "@type": "MedicalEntity",
+            "name": name,
+            "description": term.get("short_description") or term.get("meta_description"),
+            "url": url,
+            "sameAs": [link.get("url") for link in links if isinstance(link, dict)],
+            "medicineSystem": "WesternConventional",
+            "relevantSpecialty": {"@type": "MedicalSpecialty", "name": "Bariatric Surgery"},
+        },
+        {
+            "@context": "https://schema.org",
+            "@type": "BreadcrumbList",
+            "itemListElement": [
+                {"@type": "ListItem", "position": 1, "name": "Home", "item": base_url},
+                {"@type": "ListItem", "position": 2, "name": category, "item": category_url},
+                {"@type": "ListItem", "position": 3, "name": name, "item": url},
+            ],
+        },
+        {
+            "@context": "https://schema.org",
+            "@type": "Article",
+            "headline": name,
+            "description": term.get("short_description"),
+            "author": {"@type": "Organization", "name": "Parnell Wellness"},
+            "publisher": {"@type": "Organization", "name": SITE_NAME, "url": base_url},
+            "dateModified": updated_at,
+            "mainEntityOfPage": {"@type": "WebPage", "@id": url},
+        },
+    ]
+    head_extra = "\n".join(
+        [
+            '<meta property="og:type" content="article" />',
+            f'<meta property="article:section" content="{esc(category)}" />',
+            f'<meta property="article:modified_time" content="{esc(updated_at)}" />',
+            f'<meta name="keywords" content="{esc(", ".join([name, "bariatric surgery", str(category)] + list(term.get("related_terms") or [])))}" />',
+        ]
+        + [f'<script type="application/ld+json">{json_ld(data)}</script>' for data in structured]
+    )
+
+    related_list = [
+        f'<li><a href="/wiki/{esc(slug)}">{esc(related)}</a></li>' if slug else f"<li>{esc(related)}</li>"
+        for related, slug in related_items(term, slugs)
+    ]
+    reference_items = [
+        f'<li><a href="{esc(link.get("url"))}" rel="noopener noreferrer">{esc(link.get("title") or link.get("source"))}</a>'
+        + (f" - {esc(link.get('source'))}" if link.get("title") and link.get("source") else "")
+        + "</li>"
+        for link in links
+        if isinstance(link, dict)
+    ]
+
+    body = [
+        f'<nav aria-label="Breadcrumb"><a href="/">Home</a> › <a href="/category/{quote(str(category))}">{esc(category)}</a> › {esc(name)}</nav>',
+        "<article>",
+        f"<header><h1>{esc(name)}</h1>",
+    ]
+    if term.get("short_description"):
+        body.append(f'<p class="short-description">{esc(term["short_description"])}</p>')
+    body.append(f"<p>Last updated: {esc(updated_at[:10])} · Category: {esc(category)}</p></header>")
+    if term.get("description"):
+        # Descriptions are stored as trusted HTML produced by the generator
+        body.append(f'<div class="term-description">{term["description"]}</div>')
+    else:
+        body.append('<div class="term-description"><p>Description coming soon. This term is being reviewed by our medical team.</p></div>')
+    if reference_items:
+        body.append('<section id="references"><h2>References</h2><ol>' + "".join(reference_items) + "</ol></section>")
+    if related_list:
+        body.append('<aside><h3>Related Terms</h3><ul>' + "".join(related_list) + "</ul></aside>")
+    body.append("</article>")
+
+    return page_shell(f"{name} - Bariatric Surgery Term | BariWiki", description, url, head_extra, "\n".join(body))
+
+
+def render_listing(title: str, heading: str, description: str, canonical: str, terms: list) -> str:
+    items = [
+        f'<li><a href="/wiki/{esc(term["slug"])}">{esc(term["name"])}</a>'
+        + (f" - {esc(term['short_description'])}" if term.get("short_description") else "")
+        + "</li>"
+        for term in terms
+    ]
+    structured = {
+        "@context": "https://schema.org",
+        "@type": "CollectionPage",
+        "name": heading,
+        "description": description,
+        "url": canonical,
+        "hasPart": [{"@type": "MedicalEntity", "name": term["name"]} for term in terms],
+    }
+    head_extra = (
+        '<meta property="og:type" content="website" />\n'
+        f'<script type="application/ld+json">{json_ld(structured)}</script>'
+    )
+    body = f"<h1>{esc(heading)}</h1>\n<p>{len(terms)} terms</p>\n<ul>{''.join(items)}</ul>"
+    return page_shell(title, description, canonical, head_extra, body)
+
+
+def listing_fingerprint(terms: list) -> str:
+    return fingerprint([
+        (term["slug"], term["name"], term.get("short_description"), date_string(term.get("updated_at")))
+        for term in terms
+    ])
+
+
+def plan_pages(terms: list, base_url: str) -> dict:
+    """Map output path -> (fingerprint, render callable)"""
+    terms = sorted(terms, key=lambda t: t["name"])
+    slugs = {term["slug"] for term in terms}
+    pages = {}
+
+    for term in terms:
+        key = fingerprint(
+            base_url, term["slug"], date_string(term.get("updated_at")), related_items(term, slugs)
+        )
+        pages[f"wiki/{term['slug']}/index.html"] = (
+            key, lambda term=term: render_term(term, slugs, base_url)
+        )
+
+    by_letter = {}
+    by_category = {}
+    for term in terms:
+        by_letter.setdefault(term.get("first_letter") or "#", []).append(term)
+        categories = term.get("category")
+        if not isinstance(categories, list):
+            categories = [categories]
+        for category in categories:
+            if isinstance(category, str) and category:
+                by_category.setdefault(category, []).append(term)
+
+    for letter, members in by_letter.items():
+        if not letter.isalpha():
+            continue
+        canonical = f"{base_url}/browse/{letter.lower()}"
+        pages[f"browse/{letter.lower()}/index.html"] = (
+            fingerprint(base_url, listing_fingerprint(members)),
+            lambda letter=letter, members=members, canonical=canonical: render_listing(
+                f"Bariatric Surgery Terms Starting with {letter} | BariWiki",
+                f"Terms starting with {letter}",
+                f"Browse bariatric surgery terms starting with the letter {letter}.",
+                canonical,
+                members,
+            ),
+        )
+
+    for category, members in by_category.items():
+        # Category names are free text; only their slug is safe as a path
+        directory = slugify(category)
+        if not directory:
+            print(f"Skipping category {category!r}: no usable characters for a directory name")
+            continue
+        canonical = f"{base_url}/category/{quote(category)}"
+        pages[f"category/{directory}/index.html"] = (
+            fingerprint(base_url, listing_fingerprint(members)),
+            lambda category=category, members=members, canonical=canonical: render_listing(
+                f"{category} - Bariatric Surgery Category | BariWiki",
+                category,
+                f"Browse all {category.lower()} related to bariatric surgery.",
+                canonical,
+                members,
+            ),
+        )
+    return pages
+
+
+async def load_from_mongo() -> list:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        cursor = client[DB_NAME]["terms"].find({"status": "published"})
+        return [term async for term in cursor]
+    finally:
+        client.close()
+
+
+def load_from_export(path: str) -> list:
+    with open(path) as f:
+        data = json.load(f)
+    return [term for term in data.get("terms", []) if term.get("status") == "published"]
+
+
+def write_atomic(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build(terms: list, output: str, base_url: str, force: bool = False) -> dict:
+    manifest_path = os.path.join(output, MANIFEST_NAME)
+    # Read even with force: it is the only record of pages to clean up
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+
+    pages = plan_pages(terms, base_url)
+    written = unchanged = removed = 0
+    for path, (key, render) in pages.items():
+        full_path = os.path.join(output, path)
+        if not force and previous.get(path) == key and os.path.exists(full_path):
+            unchanged += 1
+            continue
+        write_atomic(full_path, render())
+        written += 1
+
+    for path in set(previous) - set(pages):
+        full_path = os.path.join(output, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+            try:
+                os.rmdir(os.path.dirname(full_path))
+            except OSError:
+                pass
+        removed += 1
+
+    write_atomic(manifest_path, json.dumps({path: key for path, (key, _) in pages.items()}, indent=1, sort_keys=True))
+    return {"written": written, "unchanged": unchanged, "removed": removed, "total": len(pages)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prerender static HTML for BariWiki pages")
+    parser.add_argument("--source", choices=["mongo", "export"], default="mongo", help="Where to read terms from (default: mongo)")
+    parser.add_argument("--export-file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bariwiki_export.json"), help="JSON export for --source export")
+    parser.add_argument("--output", default="prerendered", help="Output directory (default: prerendered)")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="Canonical site URL")
+    parser.add_argument("--force", action="store_true", help="Rewrite every page")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BariWiki Static Prerender")
+    print("=" * 60)
+
+    if args.source == "mongo":
+        print(f"Reading published terms from MongoDB: {MONGO_URL}")
+        terms = asyncio.run(load_from_mongo())
+    else:
+        print(f"Reading published terms from {args.export_file}")
+        terms = load_from_export(args.export_file)
+
+    if not terms:
+        print("No published terms found.")
+        sys.exit(1)
+
+    result = build(terms, args.output, args.base_url.rstrip("/"), force=args.force)
+    print(f"\n📄 Pages: {result['total']}")
+    print(f"   Written: {result['written']}")
+    print(f"   Unchanged: {result['unchanged']}")
+    print(f"   Removed: {result['removed']}")
+    print(f"\nOutput: {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
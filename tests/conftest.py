@@ -0,0 +1,29 @@
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# Keep the API module from opening the shared on-disk LLM reply cache
+os.environ["LLM_CACHE_MAX_MB"] = "0"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The server module wired to an in-memory mongomock database"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    import server
+
+    database = AsyncMongoMockClient()["bariwiki_test"]
+    monkeypatch.setattr(server, "terms_collection", database["terms"])
+    monkeypatch.setattr(server, "jobs_collection", database["jobs"])
+    monkeypatch.setattr(server, "corpus", server.TermCorpus())
+    monkeypatch.setattr(server, "counters", server.CorpusCounters())
+    monkeypatch.setattr(server, "pending_views", Counter())
+    server.response_cache.clear()
+    server.home_cache.clear()
+    server.admin_count_cache.clear()
+    return server
@@ -0,0 +1,254 @@
+"""Public read routes and imports against an in-memory database (see the
+api fixture in conftest.py)."""
+import asyncio
+import io
+from datetime import datetime
+
+import httpx
+
+from generation import TermLeases
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def new_term(server, name, status="published", **fields):
+    return {
+        "name": name,
+        "slug": server.slugify(name),
+        "description": f"<p>{name}</p>",
+        "short_description": name,
+        "category": "Procedures",
+        "related_terms": [],
+        "first_letter": server.get_first_letter(name),
+        "status": status,
+        "updated_at": datetime(2024, 1, 1),
+        **fields
+    }
+
+
+def client(server):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+def test_cursor_pages_cover_every_term_once(api):
+    async def scenario():
+        # Duplicate names make the _id tiebreak matter
+        names = ["Band", "Bypass", "Bypass", "Leak", "Pouch", "Sleeve", "Stricture"]
+        await api.terms_collection.insert_many([
+            new_term(api, name, slug=f"{api.slugify(name)}-{i}") for i, name in enumerate(names)
+        ])
+        seen = []
+        cursor = ""
+        async with client(api) as http:
+            while cursor is not None:
+                page = (await http.get("/api/terms", params={"cursor": cursor, "limit": 3})).json()
+                assert page["total"] == len(names)
+                seen.extend(term["slug"] for term in page["terms"])
+                cursor = page["next_cursor"]
+            bad = await http.get("/api/terms", params={"cursor": "not-a-cursor"})
+            wrong_types = await http.get("/api/terms", params={"cursor": api.encode_cursor(1, "a" * 24)})
+        assert len(seen) == len(set(seen)) == len(names)
+        assert [slug.rsplit("-", 1)[0] for slug in seen] == [api.slugify(name) for name in names]
+        assert bad.status_code == 400 and wrong_types.status_code == 400
+
+    run(scenario())
+
+
+def test_term_page_honors_conditional_gets(api):
+    async def scenario():
+        await api.terms_collection.insert_one(new_term(api, "Gastric Bypass"))
+        async with client(api) as http:
+            first = await http.get("/api/terms/slug/gastric-bypass")
+            etag = first.headers["etag"]
+            again = await http.get("/api/terms/slug/gastric-bypass", headers={"If-None-Match": etag})
+            since = await http.get(
+                "/api/terms/slug/gastric-bypass", headers={"If-Modified-Since": first.headers["last-modified"]}
+            )
+            await api.terms_collection.update_one({}, {"$set": {"updated_at": datetime(2024, 2, 1)}})
+            api.corpus.invalidate()
+            changed = await http.get("/api/terms/slug/gastric-bypass", headers={"If-None-Match": etag})
+        assert first.status_code == 200
+        assert again.status_code == 304 and again.content == b""
+        assert since.status_code == 304
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    run(scenario())
+
+
+def test_etag_differs_per_content_coding(api):
+    async def scenario():
+        await api.terms_collection.insert_one(new_term(api, "Gastric Bypass", description="<p>" + "x" * 2000 + "</p>"))
+        async with client(api) as http:
+            plain = await http.get("/api/terms/slug/gastric-bypass", headers={"Accept-Encoding": "identity"})
+            gzipped = await http.get("/api/terms/slug/gastric-bypass", headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert plain.headers["etag"] != gzipped.headers["etag"]
+        assert gzipped.json() == plain.json()
+
+    run(scenario())
+
+
+def test_search_suggests_corrections_only_for_few_hits(api):
+    async def scenario():
+        counting = "<p>Counting calories.</p>"
+        await api.terms_collection.insert_many([
+            new_term(api, "Calorie Deficit"),
+            *[new_term(api, name, description=counting) for name in ("Diet", "Meal Plan", "Snacks")],
+        ])
+        async with client(api) as http:
+            found = (await http.get("/api/terms/search", params={"q": "calories", "fuzzy": "true"})).json()
+            missed = (await http.get("/api/terms/search", params={"q": "calroie", "fuzzy": "true"})).json()
+        assert found["count"] == 3 and found["did_you_mean"] is None
+        assert missed["did_you_mean"] == "calorie"
+        assert missed["terms"][0]["name"] == "Calorie Deficit"
+
+    run(scenario())
+
+
+def test_view_counts_stay_out_of_cached_term_bodies(api):
+    async def scenario():
+        await api.terms_collection.insert_one(new_term(api, "Gastric Bypass", views=41))
+        async with client(api) as http:
+            first = await http.get("/api/terms/slug/gastric-bypass")
+            await api.flush_views()
+            api.corpus.invalidate()
+            second = await http.get("/api/terms/slug/gastric-bypass")
+        assert (await api.terms_collection.find_one({}))["views"] == 42
+        assert "views" not in first.json() and "views" not in second.json()
+        assert second.headers["etag"] == first.headers["etag"]
+
+    run(scenario())
+
+
+def test_link_graph_resolves_aliases_and_moves_backlinks(api):
+    async def scenario():
+        await api.terms_collection.insert_many([
+            new_term(api, "Gastric Bypass", related_terms=["AGB", "Not A Term"]),
+            new_term(api, "Adjustable Gastric Band (AGB; lap-band)"),
+            new_term(api, "Sleeve Gastrectomy"),
+        ])
+        await api.rebuild_link_graph()
+        source = await api.terms_collection.find_one({"slug": "gastric-bypass"})
+        band = await api.terms_collection.find_one({"name": {"$regex": "^Adjustable"}})
+        assert [link["name"] for link in source["related_links"]] == [band["name"]]
+        assert [link["name"] for link in band["backlinks"]] == ["Gastric Bypass"]
+
+        source["related_terms"] = ["Sleeve Gastrectomy"]
+        await api.terms_collection.update_one(
+            {"_id": source["_id"]}, {"$set": {"related_terms": source["related_terms"]}}
+        )
+        await api.update_forward_links(source)
+        band = await api.terms_collection.find_one({"_id": band["_id"]})
+        sleeve = await api.terms_collection.find_one({"slug": "sleeve-gastrectomy"})
+        assert band["backlinks"] == []
+        assert [link["name"] for link in sleeve["backlinks"]] == ["Gastric Bypass"]
+
+    run(scenario())
+
+
+def test_bundle_related_is_null_until_resolved(api):
+    async def scenario():
+        await api.terms_collection.insert_many([
+            new_term(api, "Gastric Bypass"), new_term(api, "Leak", related_keys=[], related_links=[])
+        ])
+        async with client(api) as http:
+            unresolved = (await http.get("/api/terms/slug/gastric-bypass/bundle")).json()
+            resolved = (await http.get("/api/terms/slug/leak/bundle")).json()
+        assert unresolved["related"] is None
+        assert resolved["related"] == []
+
+    run(scenario())
+
+
+def test_related_terms_written_by_scripts_are_relinked(api):
+    async def scenario():
+        await api.terms_collection.insert_many([
+            new_term(api, "Gastric Bypass", related_terms=["Sleeve Gastrectomy"]),
+            new_term(api, "Sleeve Gastrectomy"),
+            new_term(api, "Dumping Syndrome"),
+        ])
+        await api.rebuild_link_graph()
+        # What the generator scripts do: rewrite related_terms directly
+        await api.terms_collection.update_one(
+            {"slug": "gastric-bypass"}, {"$set": {"related_terms": ["Dumping Syndrome"]}}
+        )
+        api.corpus.invalidate()
+        async with client(api) as http:
+            stale = (await http.get("/api/terms/slug/gastric-bypass/bundle")).json()
+            assert await api.relink_stale_terms() == 1
+            assert await api.relink_stale_terms() == 0
+            bundle = (await http.get("/api/terms/slug/gastric-bypass/bundle")).json()
+            target = (await http.get("/api/terms/slug/dumping-syndrome/bundle")).json()
+            old_target = (await http.get("/api/terms/slug/sleeve-gastrectomy/bundle")).json()
+        assert stale["related"] is None
+        assert [term["name"] for term in bundle["related"]] == ["Dumping Syndrome"]
+        assert [term["name"] for term in target["backlinks"]] == ["Gastric Bypass"]
+        assert old_target["backlinks"] == []
+
+    run(scenario())
+
+
+def test_leased_and_failed_terms_stay_readable_and_private(api):
+    async def scenario():
+        await api.terms_collection.insert_many([
+            new_term(api, "Gastric Bypass", link_keys=["gastric bypass"]), new_term(api, "Leak")
+        ])
+        leases = TermLeases(api.terms_collection)
+        await leases.claim({"name": "Gastric Bypass"})
+        failed = await leases.claim({"name": "Leak"})
+        await leases.fail(failed, "provider said no")
+        async with client(api) as http:
+            responses = [
+                await http.get("/api/terms/slug/gastric-bypass"),
+                await http.get("/api/terms/slug/leak/bundle"),
+                await http.get("/api/terms"),
+            ]
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        for response in responses:
+            assert "generation_" not in response.text and "link_keys" not in response.text
+
+    run(scenario())
+
+def test_import_reports_an_outcome_per_row(api):
+    async def scenario():
+        await api.terms_collection.insert_one(new_term(api, "Gastric Bypass"))
+        upload = io.BytesIO(b"Sleeve Gastrectomy\nGastric Bypass\nsleeve gastrectomy\n!!!\n\nLeak\n")
+        progress = []
+
+        async def report(done, total=None, message=None):
+            progress.append(done)
+
+        result = await api.import_upload("terms.csv", upload, report)
+        rows = {row["row"]: (row["status"], row.get("reason")) for row in result["rows"]}
+        imported = await api.terms_collection.count_documents({"status": "draft"})
+        return result, rows, progress, imported
+
+    result, rows, progress, imported = run(scenario())
+    assert rows == {
+        1: ("imported", None),
+        2: ("duplicate", "Already exists"),
+        3: ("duplicate", "Repeated in this file"),
+        4: ("invalid", "Name has no usable characters"),
+        6: ("imported", None),
+    }
+    assert (result["imported"], result["duplicates"], result["invalid"]) == (2, 2, 1)
+    assert imported == 2 and progress[-1] == 5
+
+
+def test_job_events_need_the_jobs_own_token(api):
+    async def scenario():
+        job = {"kind": "import", "status": "completed", "progress": {}, "result": {"imported": 1}}
+        other = {"kind": "import", "status": "completed", "progress": {}, "result": None}
+        await api.jobs_collection.insert_many([job, other])
+        url = f"/api/admin/jobs/{job['_id']}/events"
+        async with client(api) as http:
+            own = await http.get(url, params={"token": api.create_job_events_token(job["_id"])})
+            wrong_job = await http.get(url, params={"token": api.create_job_events_token(other["_id"])})
+            admin = await http.get(url, params={"token": api.create_token("admin")})
+        assert own.status_code == 200 and '"imported": 1' in own.text
+        assert wrong_job.status_code == 401 and admin.status_code == 401
+        assert api.verify_token(api.create_job_events_token(job["_id"])) is None
+
+    run(scenario())
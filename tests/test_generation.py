@@ -0,0 +1,260 @@
+"""Unit tests for backend/generation.py: leases, failure ledger, rate
+limiting, batch validation and the reply cache."""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from generation import (
+    GenerationClient, LLMProvider, RateLimited, RateLimiter, ResponseCache, TermLeases,
+    batch_prompt, terms_per_request, validate_entry
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def new_collection():
+    return AsyncMongoMockClient()["bariwiki_test"]["terms"]
+
+
+class ScriptedProvider(LLMProvider):
+    """Replies (or raises) from a list, one item per request"""
+
+    name = "scripted"
+    model = "test"
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    async def send(self, system_prompt, prompt, session_id):
+        self.prompts.append(prompt)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def entry(name, **fields):
+    return {"term": name, "description": f"<p>{name}</p>", "short_description": name,
+            "category": "Procedures", "related_terms": [], "authority_links": [], **fields}
+
+
+def test_provider_must_implement_send():
+    class Unfinished(LLMProvider):
+        name = "unfinished"
+
+    with pytest.raises(TypeError):
+        Unfinished()
+
+
+# Leases
+def test_claim_is_exclusive_until_released():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_one({"name": "Gastric Bypass"})
+        first, second = TermLeases(terms, worker_id="a"), TermLeases(terms, worker_id="b")
+        claimed = await first.claim({})
+        assert claimed["generation_lease"]["worker"] == "a"
+        assert await second.claim({}) is None
+        await first.release(claimed["_id"])
+        assert (await second.claim({}))["generation_lease"]["worker"] == "b"
+
+    run(scenario())
+
+
+def test_expired_lease_can_be_claimed_by_another_worker():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_one({"name": "Gastric Bypass"})
+        crashed = TermLeases(terms, worker_id="crashed")
+        term = await crashed.claim({})
+        await terms.update_one(
+            {"_id": term["_id"]},
+            {"$set": {"generation_lease.expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        other = TermLeases(terms, worker_id="other")
+        assert (await other.claim({}))["generation_lease"]["worker"] == "other"
+        assert not await crashed.complete(term["_id"], {"description": "late"})
+
+    run(scenario())
+
+
+def test_heartbeat_extends_only_own_leases():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_many([{"name": "A"}, {"name": "B"}])
+        mine, theirs = TermLeases(terms, worker_id="mine"), TermLeases(terms, worker_id="theirs")
+        a, b = await mine.claim({"name": "A"}), await theirs.claim({"name": "B"})
+        past = datetime.utcnow() - timedelta(seconds=5)
+        await terms.update_many({}, {"$set": {"generation_lease.expires_at": past}})
+        assert await mine.heartbeat() == 1
+        a = await terms.find_one({"_id": a["_id"]})
+        b = await terms.find_one({"_id": b["_id"]})
+        assert a["generation_lease"]["expires_at"] > datetime.utcnow()
+        assert b["generation_lease"]["expires_at"] < datetime.utcnow()
+
+    run(scenario())
+
+
+def test_complete_writes_result_and_clears_lease_and_failure():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_one({"name": "A", "generation_failure": {
+            "attempts": 2, "dead_letter": False, "next_attempt_at": datetime.utcnow() - timedelta(seconds=1)
+        }})
+        leases = TermLeases(terms)
+        term = await leases.claim({})
+        assert await leases.complete(term["_id"], {"description": "done"})
+        term = await terms.find_one({"_id": term["_id"]})
+        assert term["description"] == "done"
+        assert "generation_lease" not in term and "generation_failure" not in term
+
+    run(scenario())
+
+
+# Failure ledger
+def test_failed_term_backs_off_then_dead_letters():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_one({"name": "A"})
+        leases = TermLeases(terms, max_attempts=2, retry_base=60)
+        term = await leases.claim({})
+        failure = await leases.fail(term, "bad JSON")
+        assert failure["attempts"] == 1 and not failure["dead_letter"]
+        assert await leases.claim({}) is None
+
+        await terms.update_one({}, {"$set": {"generation_failure.next_attempt_at": datetime.utcnow()}})
+        term = await leases.claim({})
+        failure = await leases.fail(term, "bad JSON again")
+        assert failure["attempts"] == 2 and failure["dead_letter"]
+        await terms.update_one({}, {"$set": {"generation_failure.next_attempt_at": datetime.utcnow()}})
+        assert await leases.claim({}) is None
+        assert [t["name"] for t in await leases.dead_letters()] == ["A"]
+
+        assert await leases.requeue_dead_letters() == 1
+        assert await leases.claim({}) is not None
+
+    run(scenario())
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    leases = TermLeases(None, retry_base=60, retry_max=200)
+    assert [leases.retry_delay(n) for n in (1, 2, 3, 4)] == [60, 120, 200, 200]
+
+
+def test_defer_keeps_the_attempt_count():
+    async def scenario():
+        terms = new_collection()
+        await terms.insert_one({"name": "A"})
+        leases = TermLeases(terms, max_attempts=1)
+        for _ in range(3):
+            term = await leases.claim({})
+            failure = await leases.defer(term, "429", delay=0)
+            assert failure["attempts"] == 0 and not failure["dead_letter"]
+        assert await leases.dead_letters() == []
+
+    run(scenario())
+
+
+# Rate limiting
+def test_throttled_backoff_doubles_and_decays():
+    limiter = RateLimiter(initial_backoff=2, max_backoff=10)
+    limiter.throttled()
+    assert limiter.backoff == 2
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.backoff == 8
+    limiter.throttled()
+    assert limiter.backoff == 10
+    assert limiter.resume_at > time.monotonic()
+    limiter.settle(0, 0)
+    assert limiter.backoff == 5
+    limiter.settle(0, 0)
+    limiter.settle(0, 0)
+    assert limiter.backoff == 1.25
+    limiter.settle(0, 0)
+    assert limiter.backoff == 0
+
+
+def test_request_bucket_paces_callers():
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=600)  # one every 0.1s once the burst is spent
+        limiter.requests.level = 0
+        started = time.monotonic()
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+        return time.monotonic() - started
+
+    assert run(scenario()) >= 0.15
+
+
+def test_rate_limited_after_retries_are_used_up():
+    async def scenario():
+        provider = ScriptedProvider([RuntimeError("429 Too Many Requests")] * 3)
+        client = GenerationClient(provider, "system", limiter=RateLimiter(initial_backoff=0.001), max_retries=2)
+        with pytest.raises(RateLimited):
+            await client.complete("prompt", "session")
+        assert client.stats["rate_limited"] == 2 and client.stats["requests"] == 3
+
+    run(scenario())
+
+
+# Batch requests
+def test_terms_per_request_fits_the_output_limit():
+    assert terms_per_request(10, 8192) == 6
+    assert terms_per_request(3, 8192) == 3
+    assert terms_per_request(5, 100) == 1
+
+
+def test_validate_entry():
+    assert validate_entry(entry("A")) is None
+    assert validate_entry([]) == "entry is not an object"
+    assert validate_entry(entry("A", description=" ")) == "missing description"
+    assert validate_entry(entry("A", related_terms="B")) == "related_terms is not a list"
+
+
+def test_batch_retries_only_the_bad_entries():
+    async def scenario():
+        provider = ScriptedProvider([
+            json.dumps([entry("A"), entry("B", description="")]),
+            json.dumps([entry("B")]),
+        ])
+        client = GenerationClient(provider, "system")
+        results, failures = await client.complete_json_batch(["A", "B", "C"], "context", "session")
+        assert sorted(results) == ["A", "B"] and "term" not in results["A"]
+        assert failures == {"C": "missing from reply"}
+        assert provider.prompts[1] == batch_prompt(["B", "C"], "context")
+
+    run(scenario())
+
+
+# Reply cache
+def test_cache_tracks_total_and_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=100)
+    cache.put("a", "x" * 40)
+    cache.put("b", "y" * 40)
+    cache.get("a")
+    cache.put("a", "x" * 10)
+    assert cache.total_bytes() == 50
+    cache.put("c", "z" * 60)
+    assert cache.get("b") is None and cache.get("a") == "x" * 10
+    assert cache.total_bytes() == 70
+    assert ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=100).total_bytes() == 70
+
+
+def test_complete_json_answers_repeats_from_the_cache(tmp_path):
+    async def scenario():
+        provider = ScriptedProvider(['{"description": "x"}'])
+        cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10000)
+        client = GenerationClient(provider, "system", cache=cache)
+        assert await client.complete_json("prompt", "s") == {"description": "x"}
+        assert await client.complete_json("prompt", "s") == {"description": "x"}
+        assert client.stats["requests"] == 1 and client.stats["cache_hits"] == 1
+
+    run(scenario())
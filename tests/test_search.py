@@ -0,0 +1,97 @@
+"""Unit tests for the in-memory search, autocomplete and spelling indexes."""
+from server import CorpusSnapshot, FuzzyIndex, PrefixIndex, SearchIndex, edit_distance
+
+
+def published(*terms):
+    docs = []
+    for i, (name, description) in enumerate(terms):
+        docs.append({
+            "_id": f"{i:024x}", "name": name, "slug": name.lower().replace(" ", "-"),
+            "description": description, "status": "published", "first_letter": name[0],
+            "category": "Procedures", "updated_at": "2024-01-01T00:00:00"
+        })
+    return CorpusSnapshot(docs, version=0)
+
+
+SNAPSHOT = published(
+    ("Gastric Bypass", "<p>Rerouting surgery that creates a small stomach pouch.</p>"),
+    ("Sleeve Gastrectomy", "<p>Removes most of the stomach.</p>"),
+    ("Gastroparesis", "<p>Delayed stomach emptying.</p>"),
+    ("Dumping Syndrome", "<p>Common after gastric bypass surgery.</p>"),
+    ("Adjustable Gastric Band (AGB; lap-band)", "<p>An inflatable band around the stomach.</p>"),
+)
+
+
+def search(query, snapshot=SNAPSHOT):
+    index = SearchIndex()
+    index.sync(snapshot)
+    return [term["name"] for term in index.search(query)]
+
+
+def test_name_hits_outrank_description_hits():
+    assert search("gastric bypass")[:2] == ["Gastric Bypass", "Dumping Syndrome"]
+
+
+def test_exact_name_match_ranks_first():
+    assert search("gastroparesis")[0] == "Gastroparesis"
+
+
+def test_html_is_not_indexed():
+    assert search("p") == []
+
+
+def test_last_token_matches_as_prefix():
+    results = search("gastr")
+    assert {"Gastric Bypass", "Sleeve Gastrectomy", "Gastroparesis"} <= set(results)
+    assert search("sleeve gastrec")[0] == "Sleeve Gastrectomy"
+
+
+def test_whole_word_hits_outrank_prefix_hits():
+    snapshot = published(
+        ("Outlet Revision", "<p>Tightening with banding.</p>"),
+        ("Pouch Revision", "<p>Tightening with a band.</p>"),
+    )
+    assert search("band", snapshot) == ["Pouch Revision", "Outlet Revision"]
+
+
+def test_sync_reindexes_changed_terms_only():
+    index = SearchIndex()
+    index.sync(SNAPSHOT)
+    docs = [dict(term) for term in SNAPSHOT.terms]
+    docs[2].update(name="Gastric Emptying Delay", updated_at="2024-02-01T00:00:00")
+    index.sync(CorpusSnapshot(docs[:4], version=1))
+    assert index.search("gastroparesis") == []
+    assert [term["name"] for term in index.search("emptying delay")][0] == "Gastric Emptying Delay"
+    assert index.search("inflatable") == []
+
+
+def test_suggest_uses_names_aliases_and_inner_words():
+    index = PrefixIndex()
+    index.sync(SNAPSHOT)
+    assert [s["name"] for s in index.suggest("gastric")] == [
+        "Gastric Bypass", "Adjustable Gastric Band (AGB; lap-band)"
+    ]
+    assert [s["name"] for s in index.suggest("lap b")] == ["Adjustable Gastric Band (AGB; lap-band)"]
+    assert [s["name"] for s in index.suggest("bypa")] == ["Gastric Bypass"]
+
+
+def test_edit_distance_counts_transpositions_once():
+    assert edit_distance("gastric", "gastirc", 2) == 1
+    assert edit_distance("sleeve", "sleve", 2) == 1
+    assert edit_distance("bypass", "gastric", 2) == 3
+
+
+def test_did_you_mean_corrects_misspelled_names():
+    index = FuzzyIndex()
+    index.sync(SNAPSHOT)
+    assert index.did_you_mean("gastirc bypss") == "gastric bypass"
+    assert index.did_you_mean("gastric bypass") is None
+    assert index.did_you_mean("xyzzy") is None
+
+
+def test_did_you_mean_leaves_a_last_token_prefix_alone():
+    index = FuzzyIndex()
+    index.sync(SNAPSHOT)
+    assert index.did_you_mean("gastr") is None
+    assert index.did_you_mean("sleeve gastr") is None
+    assert index.did_you_mean("sleve gastr") == "sleeve gastr"